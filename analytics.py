@@ -0,0 +1,141 @@
+try:
+    import numpy as np
+except ImportError:  # optional; /api/reports/workload answers 501 without it
+    np = None
+
+from scheduler import SHIFTS
+
+ROLLING_WINDOWS = (7, 30)
+
+# One pass over the window: RA id, day number (days since 1970-01-01) and the
+# shift's position in SHIFTS (-1 for anything else), all as integers
+SHIFT_CODES = ' '.join(f"WHEN '{shift}' THEN {code}" for code, shift in enumerate(SHIFTS))
+GET_DUTY_ARRAYS = f"""
+    SELECT ra_id,
+           CAST(julianday(date) - 2440587.5 AS INTEGER),
+           CASE shift {SHIFT_CODES} ELSE -1 END
+    FROM {{source}}
+    WHERE date >= ? AND date <= ?
+"""
+# MIN() and MAX() in one SELECT defeat SQLite's min/max optimization and read the
+# whole date index, so each bound is its own subquery, per partition
+GET_DATE_RANGE = "SELECT (SELECT MIN(date) FROM {table}) AS first, (SELECT MAX(date) FROM {table}) AS last"
+
+EPOCH_DAY_OFFSET = 3  # 1970-01-01 was a Thursday; (day + 3) % 7 gives Monday = 0
+
+
+def load_duty_arrays(cursor, start, end, include_archive=False):
+    """Duties in [start, end] as an (n, 3) int64 array of ra_id, day number, shift code"""
+    source = 'duty_history' if include_archive else 'duties'
+    cursor.execute(GET_DUTY_ARRAYS.format(source=source), (start, end))
+    rows = cursor.fetchall()
+    if not rows:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.array(rows, dtype=np.int64)
+
+
+def date_range(cursor, include_archive=False):
+    """First and last duty date, read from the date index; (None, None) without duties"""
+    tables = ('duties', 'duties_archive') if include_archive else ('duties',)
+    bounds = ' UNION ALL '.join(GET_DATE_RANGE.format(table=table) for table in tables)
+    cursor.execute(f"SELECT MIN(first), MAX(last) FROM ({bounds})")
+    return cursor.fetchone()
+
+
+def day_number(day):
+    """Days since 1970-01-01 for a date or YYYY-MM-DD string"""
+    return int(np.datetime64(day, 'D').astype(np.int64))
+
+
+def gini(values):
+    """Gini coefficient of non-negative counts: 0 is perfectly even, 1 is one RA doing everything"""
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    n = len(values)
+    total = values.sum()
+    if n == 0 or total == 0:
+        return 0.0
+    ranks = np.arange(1, n + 1)
+    return float(((2 * ranks - n - 1) @ values) / (n * total))
+
+
+def _per_ra_max(values, key_ra, count):
+    """Largest value per RA for values aligned with RA-sorted keys"""
+    result = np.zeros(count, dtype=np.int64)
+    if len(values):
+        group_starts = np.flatnonzero(np.r_[True, key_ra[1:] != key_ra[:-1]])
+        result[key_ra[group_starts]] = np.maximum.reduceat(values, group_starts)
+    return result
+
+
+def compute_workload(duties, ra_ids, start_day, end_day):
+    """Per-RA workload metrics and fairness scores over an (n, 3) duty array
+
+    ra_ids lists every RA to report on, including those without duties, so
+    the fairness scores count idle RAs too. Duties of RAs that are not in
+    ra_ids are ignored. Returns (per-RA metric dict of arrays, fairness dict).
+    """
+    ra_ids = np.asarray(ra_ids, dtype=np.int64)
+    count = len(ra_ids)
+    if count:
+        position = np.minimum(np.searchsorted(ra_ids, duties[:, 0]), count - 1)
+        known = ra_ids[position] == duties[:, 0]
+    else:
+        position = np.zeros(len(duties), dtype=np.int64)
+        known = np.zeros(len(duties), dtype=bool)
+    ra_index = position[known]
+    days = duties[known, 1] - start_day
+    shifts = duties[known, 2]
+
+    weekend = (days + start_day + EPOCH_DAY_OFFSET) % 7 >= 5
+    metrics = {
+        'total_duties': np.bincount(ra_index, minlength=count),
+        'weekend_duties': np.bincount(ra_index[weekend], minlength=count),
+        'weekday_duties': np.bincount(ra_index[~weekend], minlength=count),
+    }
+    named = shifts >= 0
+    shift_counts = np.bincount(
+        ra_index[named] * len(SHIFTS) + shifts[named], minlength=count * len(SHIFTS)
+    ).reshape(count, len(SHIFTS))
+    for code, shift in enumerate(SHIFTS):
+        metrics[f'{shift.lower()}_count'] = shift_counts[:, code]
+
+    # One sort of (RA, day) keys serves the streak and rolling window metrics
+    keys = np.sort((ra_index.astype(np.int64) << 32) | days)
+    key_ra = keys >> 32
+
+    # Longest run of consecutive duty days: a new run wherever the RA changes
+    # or a day is skipped (several duties on one day extend nothing)
+    distinct = keys[np.r_[True, np.diff(keys) != 0]] if len(keys) else keys
+    distinct_ra = distinct >> 32
+    starts = np.r_[True, (distinct_ra[1:] != distinct_ra[:-1]) | (np.diff(distinct) != 1)] \
+        if len(distinct) else np.zeros(0, dtype=bool)
+    run_lengths = np.diff(np.r_[np.flatnonzero(starts), len(distinct)])
+    metrics['longest_streak'] = _per_ra_max(run_lengths, distinct_ra[starts], count)
+
+    # Most duties within any `window` consecutive days: for each duty, the
+    # same RA's duties from day - window + 1 up to its day. A lower bound
+    # that underflows into the previous RA's keys still lands after them.
+    span = end_day - start_day
+    for window in ROLLING_WINDOWS:
+        first = np.searchsorted(keys, keys - (window - 1), side='left')
+        last = np.searchsorted(keys, keys, side='right')
+        metrics[f'max_{window}_day'] = _per_ra_max(last - first, key_ra, count)
+        metrics[f'last_{window}_days'] = np.bincount(ra_index[days > span - window], minlength=count)
+
+    fairness = {'total_duties': gini(metrics['total_duties']),
+                'weekend_duties': gini(metrics['weekend_duties'])}
+    for shift in SHIFTS:
+        fairness[f'{shift.lower()}_count'] = gini(metrics[f'{shift.lower()}_count'])
+    return metrics, fairness
+
+
+def workload_report(metrics, fairness, ra_ids, names):
+    """JSON-ready report: one dict per RA, busiest first, and the fairness scores"""
+    columns = {name: values.tolist() for name, values in metrics.items()}
+    ras = [
+        {'ra_id': ra_id, 'ra_name': names.get(ra_id),
+         **{name: values[index] for name, values in columns.items()}}
+        for index, ra_id in enumerate(ra_ids)
+    ]
+    ras.sort(key=lambda ra: (-ra['total_duties'], ra['ra_name'] or ''))
+    return {'ras': ras, 'fairness': fairness}
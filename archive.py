@@ -0,0 +1,40 @@
+from datetime import date
+
+from models import iso_date
+
+# Duties are range-partitioned by date: duties holds the active term(s) and
+# duties_archive everything dated before the last archive cutoff. Ordinary
+# reads, reports and conflict checks only touch duties; history queries go
+# through the duty_history view over both tables.
+COPY_TO_ARCHIVE = """
+    INSERT INTO duties_archive (id, ra_id, date, shift, notes, created_at)
+    SELECT id, ra_id, date, shift, notes, created_at FROM duties WHERE date < ?
+"""
+DELETE_ARCHIVED = "DELETE FROM duties WHERE date < ?"
+ARCHIVE_STATS = "SELECT COUNT(*), MIN(date), MAX(date) FROM duties_archive"
+
+
+def parse_cutoff(value, today=None):
+    """Validate an archive cutoff; only days up to today can be archived"""
+    cutoff = iso_date(value, 'before')
+    if cutoff > (today or date.today()).isoformat():
+        raise ValueError("before must not be in the future; only past terms are archived")
+    return cutoff
+
+
+def archive_duties(cursor, before):
+    """Move duties dated before `before` into duties_archive; returns how many moved
+
+    The caller commits. Deleting from duties fires the usual triggers, so the
+    summary counters, data version and change log all stop counting the
+    archived rows and the reports cover the hot partition only.
+    """
+    cursor.execute(COPY_TO_ARCHIVE, (before,))
+    cursor.execute(DELETE_ARCHIVED, (before,))
+    return cursor.rowcount
+
+
+def archive_stats(cursor):
+    cursor.execute(ARCHIVE_STATS)
+    count, first, last = cursor.fetchone()
+    return {"archived_duties": count, "first_date": first, "last_date": last}
@@ -0,0 +1,379 @@
+"""ASGI entry point for production serving
+
+    python asgi.py --workers 4 --port 5001
+    uvicorn asgi:application --workers 4 --port 5001
+
+The Flask handlers stay synchronous. Each request runs on a bounded thread
+pool, so the event loop never waits on SQLite and at most REQUEST_THREADS
+handlers per worker hold a pooled connection at once. Streaming responses
+(/api/events, ?stream=, exports) are each pumped by one thread of a separate
+pool, so that long-lived listeners cannot starve ordinary requests and a
+stream's pooled connection never changes threads. Scale across cores
+with --workers. Every worker process has its own connection pools, caches
+and event hubs, one set per building; a change watcher per building drops
+a worker's RA, occupancy, calendar and feed caches within CHANGE_POLL_SECONDS of
+another worker's writes, but /api/events only carries the writes handled
+by the listener's own worker, so clients should use /api/changes to catch
+up after reconnecting. Every worker also runs the background job runner,
+which shares each building's durable job queue with the other workers.
+"""
+import argparse
+import asyncio
+import io
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app import app, job_runner, router
+from change_log import ChangeWatcher, change_events
+from migrations import check_schema
+
+REQUEST_THREADS = int(os.environ.get('RA_DUTY_TRACKER_THREADS', 16))
+STREAM_THREADS = int(os.environ.get('RA_DUTY_TRACKER_STREAM_THREADS', 256))
+# Seconds uvicorn waits for open connections (event streams included) on shutdown
+SHUTDOWN_TIMEOUT = 10
+CHANGE_POLL_SECONDS = 1.0
+
+_END = object()
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and its request body into a WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class WSGIBridge:
+    """ASGI application that runs a WSGI app on bounded thread pools
+
+    Buffered responses (the ones with a Content-Length) are produced entirely
+    on the request pool. Anything else is treated as a stream and iterated,
+    and finally closed, by a single stream pool thread that hands over one
+    chunk per request from the event loop. Generators that check out a
+    connection (pagination.iter_batches) thus connect and release on the same
+    thread. The iterator is closed when the client disconnects, which ends
+    event streams and returns their connections to the pool.
+    """
+
+    def __init__(self, wsgi_app, threads=REQUEST_THREADS, stream_threads=STREAM_THREADS,
+                 on_startup=None, before_shutdown=None, after_shutdown=None):
+        self.wsgi_app = wsgi_app
+        self.on_startup = on_startup
+        self.before_shutdown = before_shutdown
+        self.after_shutdown = after_shutdown
+        self.requests = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+        self.streams = ThreadPoolExecutor(max_workers=stream_threads, thread_name_prefix='stream')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._chain_signal_handlers()
+                try:
+                    if self.on_startup is not None:
+                        await asyncio.get_running_loop().run_in_executor(None, self.on_startup)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _chain_signal_handlers(self):
+        """Run before_shutdown as soon as the server is told to stop
+
+        The server waits for open connections before the lifespan shutdown
+        event, so long-lived streams have to be ended from the signal itself.
+        """
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous = signal.getsignal(signum)
+            if not callable(previous):
+                continue
+
+            def handler(received, frame, previous=previous):
+                if self.before_shutdown is not None:
+                    self.before_shutdown()
+                previous(received, frame)
+
+            signal.signal(signum, handler)
+
+    def shutdown(self):
+        """Let in-flight requests and streams finish, then release resources
+
+        Runs in an executor, so after_shutdown may block; before_shutdown must
+        not, as it is also called from the signal handler.
+        """
+        if self.before_shutdown is not None:
+            self.before_shutdown()
+        self.requests.shutdown(wait=True)
+        self.streams.shutdown(wait=True, cancel_futures=True)
+        if self.after_shutdown is not None:
+            self.after_shutdown()
+
+    def _run(self, environ):
+        """Call the WSGI app; returns (status, headers, body or None, iterable or None)"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+            return lambda data: started.setdefault('written', []).append(data)
+
+        iterable = self.wsgi_app(environ, start_response)
+        if any(name == b'content-length' for name, _ in started['headers']):
+            try:
+                body = b''.join(started.get('written', []) + list(iterable))
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+            return started['status'], started['headers'], body, None
+        return started['status'], started['headers'], b''.join(started.get('written', [])), iterable
+
+    async def _http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, b''.join(chunks))
+        status, headers, body, iterable = await loop.run_in_executor(self.requests, self._run, environ)
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if iterable is None:
+            await send({'type': 'http.response.body', 'body': body})
+            return
+        await self._stream(iterable, body, receive, send)
+
+    async def _stream(self, iterable, first_chunk, receive, send):
+        disconnected = asyncio.Event()
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch())
+        requests = queue.SimpleQueue()
+        pump = self.streams.submit(self._pump, iterable, requests)
+        pumping = asyncio.wrap_future(pump)
+        try:
+            if first_chunk:
+                await send({'type': 'http.response.body', 'body': first_chunk, 'more_body': True})
+            while not disconnected.is_set():
+                reply = Future()
+                requests.put(reply)
+                await asyncio.wait({asyncio.wrap_future(reply), pumping},
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not reply.done():
+                    # The pump was cancelled on shutdown before it answered
+                    break
+                chunk = reply.result()
+                if chunk is _END or disconnected.is_set():
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not disconnected.is_set():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            # The pump closes the iterable once it has finished its current chunk;
+            # one that never started is closed here
+            requests.put(None)
+            if pump.cancel():
+                self._close_iterable(iterable)
+
+    @staticmethod
+    def _pump(iterable, requests):
+        """Advance a response iterable on this thread, one chunk per request, then close it
+
+        A request is a Future for the next chunk (_END after the last one);
+        None stops the pump early.
+        """
+        iterator = iter(iterable)
+        try:
+            while True:
+                reply = requests.get()
+                if reply is None or not reply.set_running_or_notify_cancel():
+                    return
+                try:
+                    chunk = next(iterator, _END)
+                except BaseException as e:
+                    reply.set_exception(e)
+                    return
+                reply.set_result(chunk)
+                if chunk is _END:
+                    return
+        finally:
+            WSGIBridge._close_iterable(iterable)
+
+    @staticmethod
+    def _close_iterable(iterable):
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+_watchers_lock = threading.Lock()
+change_watchers = []
+
+
+def _invalidate_caches(shard):
+    def invalidate(changes):
+        if changes is None:
+            shard.ra_directory.invalidate()
+            shard.occupancy.invalidate()
+            shard.calendar_cache.invalidate()
+            shard.feed_cache.invalidate()
+            return
+        entities = {change['entity'] for change in changes}
+        if 'ra' in entities:
+            shard.ra_directory.invalidate()
+        if 'duty' in entities:
+            shard.occupancy.invalidate()
+        # Same events as in-process writes, so only the touched windows and feeds go
+        for event_type, data in change_events(changes):
+            shard.calendar_cache.handle_event(event_type, data)
+            shard.feed_cache.handle_event(event_type, data)
+    return invalidate
+
+
+def _watch_shard(shard):
+    """Start a change watcher for a building as soon as this worker opens it"""
+    watcher = ChangeWatcher(shard.pool.connect, _invalidate_caches(shard), CHANGE_POLL_SECONDS)
+    with _watchers_lock:
+        change_watchers.append(watcher)
+    watcher.start()
+
+
+def _startup():
+    # Workers only verify the schemas; `flask --app app init-db` creates and migrates them.
+    # Buildings added after startup are opened, and watched, on their first request.
+    opened = router.open_shards()
+    router.on_open = _watch_shard
+    for shard in opened:
+        _watch_shard(shard)
+    for shard in router.shards():
+        check_schema(shard.connect, shard.building)
+    # Every worker runs jobs; claims are atomic, so each job runs once
+    job_runner.start()
+
+
+def _before_shutdown():
+    # Runs in the signal handler on the event loop's thread, so nothing here waits:
+    # end event streams so their threads can be joined, and stop polling and claiming
+    for shard in router.open_shards():
+        shard.event_hub.close()
+    with _watchers_lock:
+        watchers = list(change_watchers)
+    for watcher in watchers:
+        watcher.stop(wait=False)
+    job_runner.request_stop()
+
+
+def _after_shutdown():
+    with _watchers_lock:
+        watchers = list(change_watchers)
+    for watcher in watchers:
+        watcher.stop()
+    # Running jobs finish and record their outcome; queued ones wait for the next start
+    job_runner.stop()
+    # The pools are closed once nothing can check a connection out
+    router.dispose()
+
+
+application = WSGIBridge(
+    app,
+    on_startup=_startup,
+    before_shutdown=_before_shutdown,
+    after_shutdown=_after_shutdown
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the RA duty tracker API over ASGI")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)),
+                        help='Worker processes (default: WEB_CONCURRENCY or the number of CPUs)')
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+        from uvicorn.supervisors import Multiprocess
+    except ImportError:
+        raise SystemExit("uvicorn is required for serving: pip install uvicorn")
+
+    config = uvicorn.Config(
+        'asgi:application',
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        lifespan='on',
+        timeout_graceful_shutdown=SHUTDOWN_TIMEOUT,
+    )
+    if config.workers == 1:
+        uvicorn.Server(config).run()
+        return
+
+    sock = config.bind_socket()
+    # Worker processes get the listening socket without its protocol number,
+    # so asyncio skips TCP_NODELAY on accepted connections and every
+    # keep-alive response waits ~40 ms on delayed ACKs. Accepted sockets
+    # inherit the option from the listener.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    Multiprocess(config, sockets=[sock]).run()
+
+
+if __name__ == '__main__':
+    main()
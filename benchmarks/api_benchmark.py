@@ -0,0 +1,324 @@
+"""Reproducible load benchmark for the Flask API
+
+Seeds a scratch SQLite database with synthetic RAs and duties at increasing
+scales, drives the /api/duties, /api/ras and /api/reports endpoints through
+the Flask test client from concurrent workers, and records p50/p95/p99
+latency and throughput per endpoint in a JSON file.
+
+    python benchmarks/api_benchmark.py --scales 1k,100k --output bench.json
+    python benchmarks/api_benchmark.py --scales 1k --baseline benchmarks/baseline.json
+
+With --baseline, any endpoint whose p95 latency rises or whose throughput
+drops by more than --threshold (default 25%) fails the run with exit code 1.
+
+With --asgi-workers, the read endpoints are instead driven over HTTP against
+asgi.py started with each of the given worker counts, to show how
+throughput scales with worker processes:
+
+    python benchmarks/api_benchmark.py --scales 100k --asgi-workers 1,2,4
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SHIFTS = ('Primary', 'Secondary', 'Tertiary')
+RA_COUNT = 40
+FIRST_DAY = date(1200, 1, 1)
+# POST /api/duties writes land from here on, clear of the seeded days
+WRITE_FIRST_DAY = date(9000, 1, 1)
+SEED_BATCH = 10000
+
+# Endpoints whose response grows with the whole table are skipped above this many duties
+UNBOUNDED_MAX_DUTIES = 100000
+
+
+def parse_scale(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def seed(app_module, target):
+    """Grow the duties table to `target` rows, three shifts per day
+
+    Seeding continues on the day after the latest duty before WRITE_FIRST_DAY
+    (FIRST_DAY on an empty table), so rows already in the table never take a
+    (date, shift) slot the seed wants.
+    """
+    conn = app_module.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM ras")
+    if cursor.fetchone()[0] < RA_COUNT:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO ras (name, email) VALUES (?, ?)",
+            [(f"Bench RA {i}", f"bench{i}@example.edu") for i in range(RA_COUNT)]
+        )
+    cursor.execute("SELECT id FROM ras")
+    ra_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT COUNT(*) FROM duties")
+    existing = cursor.fetchone()[0]
+    cursor.execute("SELECT MAX(date) FROM duties WHERE date < ?", (WRITE_FIRST_DAY.isoformat(),))
+    latest = cursor.fetchone()[0]
+    first_day = date.fromisoformat(latest) + timedelta(days=1) if latest else FIRST_DAY
+
+    rng = random.Random(existing)
+    for start in range(0, target - existing, SEED_BATCH):
+        rows = []
+        for n in range(start, min(start + SEED_BATCH, target - existing)):
+            day = first_day + timedelta(days=n // 3)
+            rows.append((rng.choice(ra_ids), day.isoformat(), SHIFTS[n % 3], f"Synthetic duty {existing + n}"))
+        cursor.executemany(app_module.PreparedStatements.INSERT_DUTY, rows)
+        conn.commit()
+    conn.close()
+    app_module.ra_directory.invalidate()
+    app_module.occupancy.invalidate()
+    return ra_ids
+
+
+def scenarios(duty_count, ra_ids, write_counter):
+    """(name, callable(client) -> response) pairs for the current data size"""
+    last_day = FIRST_DAY + timedelta(days=max(duty_count // 3 - 1, 0))
+    month_start = (last_day - timedelta(days=30)).isoformat()
+    year = last_day.year
+
+    def new_duty(client):
+        with write_counter['lock']:
+            write_counter['n'] += 1
+            n = write_counter['n']
+        return client.post('/api/duties', json={
+            'ra_name': 'Bench RA 0',
+            'date': (WRITE_FIRST_DAY + timedelta(days=n)).isoformat(),
+            'shift': 'Primary'
+        })
+
+    cases = [
+        ('GET /api/duties?limit=100', lambda c: c.get('/api/duties?limit=100')),
+        ('GET /api/duties?start_date&end_date', lambda c: c.get(
+            f'/api/duties?start_date={month_start}&end_date={last_day.isoformat()}')),
+        ('GET /api/duties?ra&limit=100', lambda c: c.get('/api/duties?ra=Bench%20RA%207&limit=100')),
+        ('GET /api/duties/<id>', lambda c: c.get(f'/api/duties/{random.randint(1, max(duty_count, 1))}')),
+        ('GET /api/ras', lambda c: c.get('/api/ras')),
+        ('GET /api/ras/<id>', lambda c: c.get(f'/api/ras/{random.choice(ra_ids)}')),
+        ('GET /api/reports/ra-duties', lambda c: c.get('/api/reports/ra-duties')),
+        ('GET /api/reports/monthly-summary', lambda c: c.get(f'/api/reports/monthly-summary?year={year}')),
+        ('GET /api/reports/workload', lambda c: c.get('/api/reports/workload')),
+        ('POST /api/duties', new_duty),
+    ]
+    if duty_count <= UNBOUNDED_MAX_DUTIES:
+        cases.insert(0, ('GET /api/duties', lambda c: c.get('/api/duties')))
+    return cases
+
+
+class HTTPResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.data = body
+
+
+class HTTPClient:
+    """Keep-alive HTTP client with the subset of the test client API the scenarios use"""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def _request(self, method, path, body=None, headers=None):
+        self.conn.request(method, path, body=body, headers=headers or {})
+        response = self.conn.getresponse()
+        return HTTPResponse(response.status, response.read())
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path, json=None):
+        return self._request('POST', path, body=globals()['json'].dumps(json),
+                             headers={'Content-Type': 'application/json'})
+
+
+def start_server(workers, port, db_path):
+    """Start asgi.py with `workers` processes and wait until it answers"""
+    env = dict(os.environ, RA_DUTY_TRACKER_DB=db_path)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'asgi.py'), '--workers', str(workers), '--port', str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if HTTPClient(port).get('/api/ras').status_code == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"asgi.py with {workers} workers did not start")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_scenario(make_client, call, workers, requests_per_worker):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        client = make_client()
+        local = []
+        failed = 0
+        for _ in range(requests_per_worker):
+            start = time.perf_counter()
+            response = call(client)
+            local.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(worker) for _ in range(workers)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions against a baseline results file"""
+    regressions = []
+    for scale, endpoints in results['results'].items():
+        for name, current in endpoints.items():
+            previous = baseline.get('results', {}).get(scale, {}).get(name)
+            if not previous:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                regressions.append(f"{scale} {name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+            if current['throughput_rps'] < previous['throughput_rps'] * (1 - threshold):
+                regressions.append(
+                    f"{scale} {name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s"
+                )
+    return regressions
+
+
+def report(name, stats):
+    print(f"  {name:40s} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+          f"p99 {stats['p99_ms']:8.2f} ms  {stats['throughput_rps']:8.1f} req/s  errors {stats['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='1k,100k,1m', help='Comma-separated duty counts, e.g. 1k,100k,1m')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50, help='Requests per worker per endpoint')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--asgi-workers', help='Comma-separated worker counts to serve with asgi.py, e.g. 1,2,4')
+    parser.add_argument('--port', type=int, default=5099, help='Port for --asgi-workers servers')
+    args = parser.parse_args()
+
+    scales = sorted((parse_scale(label), label.strip()) for label in args.scales.split(','))
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['RA_DUTY_TRACKER_DB'] = os.path.join(tmp.name, 'bench.db')
+
+    import app as app_module
+    # Synthetic duties only; the demo rows would sit among the seeded days
+    app_module.init_database(sample_data=False)
+
+    # Lock waits under load would flood the output with slow-query warnings
+    logging.getLogger('metrics').setLevel(logging.ERROR)
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'workers': args.workers,
+            'requests_per_worker': args.requests,
+            'asgi_workers': args.asgi_workers,
+            'cpus': os.cpu_count(),
+        },
+        'results': {}
+    }
+    write_counter = {'n': 0, 'lock': threading.Lock()}
+
+    for scale, label in scales:
+        started = time.perf_counter()
+        ra_ids = seed(app_module, scale)
+        print(f"seeded {scale} duties in {time.perf_counter() - started:.1f}s")
+
+        if not args.asgi_workers:
+            scale_results = {}
+            for name, call in scenarios(scale, ra_ids, write_counter):
+                stats = run_scenario(app_module.app.test_client, call, args.workers, args.requests)
+                scale_results[name] = stats
+                report(name, stats)
+            results['results'][label] = scale_results
+            continue
+
+        # Read-heavy endpoints only, so runs with different worker counts see the same data
+        reads = [(name, call) for name, call in scenarios(scale, ra_ids, write_counter)
+                 if name.startswith('GET ')]
+        for worker_count in [int(n) for n in args.asgi_workers.split(',')]:
+            print(f" asgi.py --workers {worker_count}")
+            server = start_server(worker_count, args.port, os.environ['RA_DUTY_TRACKER_DB'])
+            try:
+                scale_results = {}
+                for name, call in reads:
+                    stats = run_scenario(lambda: HTTPClient(args.port), call, args.workers, args.requests)
+                    scale_results[name] = stats
+                    report(name, stats)
+            finally:
+                stop_server(server)
+            results['results'][f"{label}@{worker_count}w"] = scale_results
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"wrote {args.output}")
+
+    app_module.pool.dispose()
+    tmp.cleanup()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Load benchmark for the SQLite connection layer
+
+Runs the same mix of duty reads and writes that the API handlers issue, once
+with a fresh sqlite3 connection per request (the old get_db_connection()) and
+once through the shared ConnectionPool, and prints requests/second for each.
+
+    python benchmarks/pool_benchmark.py --threads 8 --seconds 5
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionPool  # noqa: E402
+
+SHIFTS = ('Primary', 'Secondary', 'Tertiary')
+
+
+def seed(path, ra_count=40, duty_count=5000):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE ras (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, email TEXT)")
+    conn.execute("""
+        CREATE TABLE duties (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ra_id INTEGER NOT NULL,
+            ra_name TEXT NOT NULL,
+            date TEXT NOT NULL,
+            shift TEXT NOT NULL,
+            notes TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO ras (id, name, email) VALUES (?, ?, ?)",
+        [(i, f"RA {i}", f"ra{i}@example.edu") for i in range(1, ra_count + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO duties (ra_id, ra_name, date, shift) VALUES (?, ?, ?, ?)",
+        [
+            (ra_id, f"RA {ra_id}", f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}", random.choice(SHIFTS))
+            for ra_id in (random.randint(1, ra_count) for _ in range(duty_count))
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def handle_request(connect, write_ratio):
+    """One simulated API request: open, query or insert, commit, close"""
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        if random.random() < write_ratio:
+            ra_id = random.randint(1, 40)
+            cursor.execute(
+                "INSERT INTO duties (ra_id, ra_name, date, shift, notes) VALUES (?, ?, ?, ?, ?)",
+                (ra_id, f"RA {ra_id}", "2025-06-01", random.choice(SHIFTS), "")
+            )
+            conn.commit()
+        else:
+            month = random.randint(1, 12)
+            cursor.execute(
+                "SELECT * FROM duties WHERE date >= ? AND date <= ? ORDER BY date",
+                (f"2025-{month:02d}-01", f"2025-{month:02d}-07")
+            )
+            cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def run(connect, threads, seconds, write_ratio):
+    deadline = time.perf_counter() + seconds
+    completed = [0] * threads
+    locked = [0] * threads
+
+    def worker(index):
+        while time.perf_counter() < deadline:
+            try:
+                handle_request(connect, write_ratio)
+                completed[index] += 1
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                locked[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(completed) / elapsed, sum(locked)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, 'before.db')
+        after_path = os.path.join(tmp, 'after.db')
+        seed(before_path)
+        seed(after_path)
+
+        rps, locked = run(lambda: sqlite3.connect(before_path), args.threads, args.seconds, args.write_ratio)
+        print(f"before (connect per request): {rps:10.1f} req/s  {locked} 'database is locked' errors")
+
+        pool = ConnectionPool(after_path, max_idle=args.threads)
+        rps, locked = run(pool.connect, args.threads, args.seconds, args.write_ratio)
+        pool.dispose()
+        print(f"after  (shared WAL pool):     {rps:10.1f} req/s  {locked} 'database is locked' errors")
+
+
+if __name__ == '__main__':
+    main()
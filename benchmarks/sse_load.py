@@ -0,0 +1,80 @@
+"""Load test for the /api/events push channel
+
+Attaches hundreds of subscribers to an EventHub, each consumed by its own
+thread through the same sse_stream() generator the endpoint serves. It then
+measures process CPU while nothing changes and delivery latency while events
+are published.
+
+    python benchmarks/sse_load.py --subscribers 500 --idle-seconds 5
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from events import EventHub, sse_stream  # noqa: E402
+
+
+def consume(stream, received, stop):
+    for chunk in stream:
+        if stop.is_set():
+            break
+        if 'event: duty.created' in chunk:
+            for line in chunk.splitlines():
+                if line.startswith('data:') and '"sent"' in line:
+                    sent = float(line.split('"sent":')[1].split('}')[0])
+                    received.append(time.perf_counter() - sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--idle-seconds', type=float, default=5.0)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--heartbeat', type=float, default=15.0)
+    args = parser.parse_args()
+
+    hub = EventHub(max_subscribers=args.subscribers)
+    stop = threading.Event()
+    received = []
+    threads = []
+    for _ in range(args.subscribers):
+        subscriber = hub.subscribe()
+        stream = sse_stream(hub, subscriber, heartbeat=args.heartbeat)
+        thread = threading.Thread(target=consume, args=(stream, received, stop), daemon=True)
+        thread.start()
+        threads.append(thread)
+    time.sleep(0.5)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    time.sleep(args.idle_seconds)
+    idle_cpu = time.process_time() - cpu_start
+    idle_wall = time.perf_counter() - wall_start
+    print(f"{hub.subscriber_count()} subscribers idle for {idle_wall:.1f}s: "
+          f"{idle_cpu * 1000:.1f} ms CPU ({100 * idle_cpu / idle_wall:.2f}% of one core)")
+
+    cpu_start = time.process_time()
+    for i in range(args.events):
+        hub.publish('duty.created', {"id": i, "sent": time.perf_counter()})
+        time.sleep(0.01)
+    deadline = time.perf_counter() + 5
+    expected = args.events * args.subscribers
+    while len(received) < expected and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    busy_cpu = time.process_time() - cpu_start
+
+    latencies = sorted(received)
+    if latencies:
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        print(f"delivered {len(latencies)}/{expected} events, latency p50 {p50:.2f} ms, p99 {p99:.2f} ms, "
+              f"{busy_cpu * 1000:.1f} ms CPU")
+    stop.set()
+
+
+if __name__ == '__main__':
+    main()
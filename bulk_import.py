@@ -0,0 +1,130 @@
+import csv
+import io
+
+from models import iso_date
+from ra_directory import RAEntry, normalize_name
+
+# Columns read from CSV uploads; ra_name, date and shift are required
+CSV_COLUMNS = ('ra_name', 'date', 'shift', 'notes', 'ra_email')
+
+INSERT_RA = "INSERT INTO ras (name, email) VALUES (?, ?)"
+SELECT_RAS_BY_NAME = "SELECT id, name, email FROM ras WHERE lower(name) IN ({placeholders})"
+
+
+def parse_csv(text):
+    """Parse CSV text with a header row into a list of duty dicts"""
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'ra_name' not in [name.strip() for name in reader.fieldnames]:
+        raise ValueError("CSV must have a header row with ra_name, date and shift columns")
+    return [
+        {key.strip(): (value or '').strip() for key, value in row.items() if key is not None}
+        for row in reader
+    ]
+
+
+def validate_rows(rows):
+    """Split rows into valid duties and per-row errors
+
+    Returns (valid, errors) where valid is a list of (row number, duty dict)
+    and errors is a list of {"row": n, "error": message}. Row numbers are
+    zero-based positions in the submitted list.
+    """
+    valid = []
+    errors = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({"row": index, "error": "Each duty must be an object"})
+            continue
+        ra_name = str(row.get('ra_name') or '').strip()
+        if not ra_name or not row.get('date') or not row.get('shift'):
+            errors.append({"row": index, "error": "RA name, date and shift are required"})
+            continue
+        try:
+            day = iso_date(row['date'])
+        except ValueError as e:
+            errors.append({"row": index, "error": str(e)})
+            continue
+        valid.append((index, {
+            'ra_name': ra_name,
+            'ra_email': row.get('ra_email') or '',
+            'date': day,
+            'shift': str(row['shift']).strip(),
+            'notes': row.get('notes') or ''
+        }))
+    return valid, errors
+
+
+def import_duties(conn, rows, insert_duty, directory, occupancy):
+    """Insert validated duties in a single transaction
+
+    RA names are resolved case-insensitively through the RA directory; RAs
+    that do not exist yet are created in one batch before the duties are
+    inserted with executemany. Rows that would duplicate a shift or
+    double-book an RA, against existing duties or earlier rows of the same
+    import, are skipped. Returns a summary dict with inserted/created counts
+    and the per-row errors.
+    """
+    valid, errors = validate_rows(rows)
+    if not valid:
+        return {"inserted": 0, "created_ras": 0, "errors": errors}
+
+    resolved = {}
+    missing = {}
+    for _, duty in valid:
+        key = normalize_name(duty['ra_name'])
+        if key in resolved or key in missing:
+            continue
+        entry = directory.find(duty['ra_name'])
+        if entry:
+            resolved[key] = entry
+        else:
+            missing[key] = (duty['ra_name'], duty['ra_email'])
+
+    cursor = conn.cursor()
+    created = []
+    try:
+        if missing:
+            cursor.executemany(INSERT_RA, list(missing.values()))
+            names = [name for name, _ in missing.values()]
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                cursor.execute(
+                    SELECT_RAS_BY_NAME.format(placeholders=', '.join(['lower(?)'] * len(chunk))),
+                    chunk
+                )
+                created.extend(RAEntry(*row) for row in cursor.fetchall())
+            resolved.update((normalize_name(entry.name), entry) for entry in created)
+
+        occupancy.preload(min(duty['date'] for _, duty in valid), max(duty['date'] for _, duty in valid))
+        claimed_shifts = {}
+        claimed_ras = {}
+        duty_rows = []
+        for index, duty in valid:
+            entry = resolved[normalize_name(duty['ra_name'])]
+            conflicts = occupancy.check(duty['date'], duty['shift'], entry.id)
+            shift_key = (duty['date'], duty['shift'])
+            ra_key = (duty['date'], entry.id)
+            if shift_key in claimed_shifts:
+                conflicts.append({"type": "duplicate_shift", "row": claimed_shifts[shift_key]})
+            elif ra_key in claimed_ras:
+                conflicts.append({"type": "double_booked", "row": claimed_ras[ra_key]})
+            if conflicts:
+                errors.append({"row": index, "error": "Conflicts with another duty", "conflicts": conflicts})
+                continue
+            claimed_shifts[shift_key] = index
+            claimed_ras[ra_key] = index
+            duty_rows.append((entry.id, duty['date'], duty['shift'], duty['notes']))
+
+        cursor.executemany(insert_duty, duty_rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for entry in created:
+        directory.put(entry.id, entry.name, entry.email)
+    if duty_rows:
+        occupancy.invalidate()
+    errors.sort(key=lambda error: error['row'])
+
+    return {"inserted": len(duty_rows), "created_ras": len(missing), "errors": errors}
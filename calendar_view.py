@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from scheduler import SHIFTS
+
+VIEWS = ('month', 'week')
+
+GET_DUTIES_IN_WINDOW = """
+    SELECT d.id, d.ra_id, r.name AS ra_name, d.date, d.shift, d.notes, d.created_at
+    FROM duties d LEFT JOIN ras r ON r.id = d.ra_id
+    WHERE d.date >= ? AND d.date <= ?
+    ORDER BY d.date, d.id
+"""
+
+
+def calendar_window(view, anchor):
+    """First and last day of the month, or the Sunday-to-Saturday week, containing anchor
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    if view not in VIEWS:
+        raise ValueError(f"view must be one of {', '.join(VIEWS)}")
+    try:
+        day = date.fromisoformat(anchor) if anchor else date.today()
+    except ValueError:
+        raise ValueError("anchor must be a date in YYYY-MM-DD format")
+
+    if view == 'week':
+        # Weeks start on Sunday, like the calendar grid in the web client
+        start = day - timedelta(days=(day.weekday() + 1) % 7)
+        return start, start + timedelta(days=6)
+    start = day.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
+def build_calendar(cursor, start, end):
+    """Duties in [start, end] grouped per day, with each shift's coverage, from one range query"""
+    cursor.execute(GET_DUTIES_IN_WINDOW, (start.isoformat(), end.isoformat()))
+    columns = [column[0] for column in cursor.description]
+    by_day = {}
+    for row in cursor.fetchall():
+        duty = dict(zip(columns, row))
+        by_day.setdefault(duty['date'], []).append(duty)
+
+    days = []
+    for offset in range((end - start).days + 1):
+        day = (start + timedelta(days=offset)).isoformat()
+        duties = by_day.get(day, [])
+        covered = {duty['shift'] for duty in duties}
+        coverage = {shift: shift in covered for shift in SHIFTS}
+        days.append({
+            "date": day,
+            "duties": duties,
+            "coverage": coverage,
+            "fully_covered": all(coverage.values())
+        })
+    return days
+
+
+class CalendarCache:
+    """LRU of built calendar windows, dropped only by writes that fall inside them
+
+    Listens to the event hub: a duty created, moved or deleted evicts the
+    windows holding its old and new dates, while RA renames and deletions
+    (which cascade to the RA's duties) and bulk imports clear everything. A
+    generation counter keeps a window that was being built while a write
+    landed from being stored.
+    """
+
+    def __init__(self, max_windows=64):
+        self.max_windows = max_windows
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, start, end, build):
+        key = (start, end)
+        with self._lock:
+            if key in self._windows:
+                self.hits += 1
+                self._windows.move_to_end(key)
+                return self._windows[key]
+            self.misses += 1
+            generation = self._generation
+
+        days = build(start, end)
+
+        with self._lock:
+            if generation == self._generation:
+                self._windows[key] = days
+                while len(self._windows) > self.max_windows:
+                    self._windows.popitem(last=False)
+        return days
+
+    def invalidate_dates(self, dates):
+        dates = [date.fromisoformat(day) for day in dates if day]
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._windows if any(key[0] <= day <= key[1] for day in dates)]:
+                del self._windows[key]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._windows), 'hits': self.hits, 'misses': self.misses}
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._windows.clear()
+
+    def handle_event(self, event_type, data):
+        """Event hub listener"""
+        if event_type in ('duty.created', 'duty.updated', 'duty.deleted'):
+            try:
+                self.invalidate_dates([data.get('date'), data.get('previous_date')])
+            except ValueError:
+                # Dates that are not ISO days can't be matched to a window
+                self.invalidate()
+        elif event_type in ('duties.imported', 'ra.updated', 'ra.deleted'):
+            self.invalidate()
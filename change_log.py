@@ -0,0 +1,189 @@
+import threading
+
+DEFAULT_CHANGE_LIMIT = 1000
+MAX_CHANGE_LIMIT = 5000
+
+# entity name used in change_log -> table it tracks
+TRACKED_TABLES = {
+    'duty': 'duties',
+    'ra': 'ras',
+}
+
+GET_CHANGES = "SELECT seq, entity, entity_id, op FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?"
+GET_OLDEST_SEQ = "SELECT MIN(seq) FROM change_log"
+GET_LATEST_SEQ = "SELECT seq FROM sqlite_sequence WHERE name = 'change_log'"
+GET_CHANGED_ROWS = """
+    SELECT seq, entity, entity_id, op, date, ra_id, previous_date, previous_ra_id
+    FROM change_log WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?
+"""
+
+# Changes a watcher goes through one by one; beyond this it reports that everything changed
+WATCH_CHANGE_LIMIT = 1000
+
+# (entity, op) in change_log -> the event hub event an in-process write publishes
+CHANGE_EVENTS = {
+    ('duty', 'insert'): 'duty.created',
+    ('duty', 'update'): 'duty.updated',
+    ('duty', 'delete'): 'duty.deleted',
+    ('ra', 'insert'): 'ra.created',
+    ('ra', 'update'): 'ra.updated',
+    ('ra', 'delete'): 'ra.deleted',
+}
+
+# Current rows for upserted ids, per table. Duties carry ra_name joined from ras, so an
+# RA rename reaches sync clients as one ras upsert rather than one per duty
+GET_ROWS = {
+    'duties': """
+        SELECT d.id, d.ra_id, r.name AS ra_name, d.date, d.shift, d.notes, d.created_at
+        FROM duties d LEFT JOIN ras r ON r.id = d.ra_id
+        WHERE d.id IN ({placeholders})
+    """,
+    'ras': "SELECT id, name, email FROM ras WHERE id IN ({placeholders})",
+}
+
+
+class ChangeLogExpired(Exception):
+    """The requested position was pruned from the change log; a full resync is needed"""
+
+
+def get_changes(cursor, since, limit):
+    """Collect what changed after sequence number `since`
+
+    Several changes to the same row collapse into one: rows that still exist
+    are returned in full, rows that were deleted come back as tombstone ids.
+    Expects a cursor with sqlite3.Row as row factory.
+    """
+    cursor.execute(GET_OLDEST_SEQ)
+    oldest = cursor.fetchone()[0]
+    if oldest is not None and since < oldest - 1:
+        raise ChangeLogExpired(f"Changes before sequence {oldest} have been pruned")
+
+    cursor.execute(GET_CHANGES, (since, limit + 1))
+    entries = cursor.fetchall()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {entity: {} for entity in TRACKED_TABLES}
+    for entry in entries:
+        latest[entry['entity']][entry['entity_id']] = entry['op']
+
+    result = {}
+    for entity, table in TRACKED_TABLES.items():
+        ids = [entity_id for entity_id, op in latest[entity].items() if op != 'delete']
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(GET_ROWS[table].format(placeholders=', '.join('?' * len(chunk))), chunk)
+            rows.update((row['id'], dict(row)) for row in cursor.fetchall())
+
+        # A row missing here was deleted by a change past this page
+        deleted = [entity_id for entity_id in latest[entity] if entity_id not in rows]
+        result[table] = {
+            'upserts': sorted(rows.values(), key=lambda row: row['id']),
+            'deletes': sorted(deleted)
+        }
+
+    if entries:
+        next_seq = entries[-1]['seq']
+    else:
+        cursor.execute(GET_LATEST_SEQ)
+        row = cursor.fetchone()
+        next_seq = max(since, row[0]) if row else since
+
+    return {'since': since, 'next': next_seq, 'has_more': has_more, **result}
+
+
+def prune_change_log(cursor, keep_days):
+    """Delete log entries older than keep_days, always keeping the newest entry
+
+    Returns the number of entries removed.
+    """
+    cursor.execute('''
+        DELETE FROM change_log
+        WHERE changed_at < datetime('now', ?)
+          AND seq < (SELECT MAX(seq) FROM change_log)
+    ''', (f'-{int(keep_days)} days',))
+    return cursor.rowcount
+
+
+def change_events(changes):
+    """Yield (event_type, data) pairs shaped like the event hub's for logged changes"""
+    for change in changes:
+        event_type = CHANGE_EVENTS[(change['entity'], change['op'])]
+        if change['entity'] == 'duty':
+            yield event_type, {
+                'id': change['entity_id'],
+                'date': change['date'],
+                'ra_id': change['ra_id'],
+                'previous_date': change['previous_date'],
+                'previous_ra_id': change['previous_ra_id'],
+            }
+        else:
+            yield event_type, {'id': change['entity_id']}
+
+
+class ChangeWatcher:
+    """Background poller that reports what changed since its last look
+
+    Lets a server worker drop in-memory caches after another process (a
+    second worker, a CLI command) writes to the database. on_change(changes)
+    gets the change_log rows as dicts, or None when they can't be listed
+    (pruned in the meantime, more than WATCH_CHANGE_LIMIT, or duty changes
+    logged before their dates were) and everything must be assumed changed.
+    The process's own writes are reported too, so on_change must be safe to
+    repeat.
+    """
+
+    def __init__(self, connect, on_change, interval=1.0):
+        self._connect = connect
+        self._on_change = on_change
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+        self.seq = None
+
+    def _latest(self, cursor):
+        cursor.execute(GET_LATEST_SEQ)
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def _changes(self, cursor, latest):
+        cursor.execute(GET_CHANGED_ROWS, (self.seq, latest, WATCH_CHANGE_LIMIT + 1))
+        columns = [column[0] for column in cursor.description]
+        changes = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        if not changes or changes[0]['seq'] != self.seq + 1 or len(changes) > WATCH_CHANGE_LIMIT:
+            return None
+        if any(change['entity'] == 'duty' and change['date'] is None for change in changes):
+            return None
+        return changes
+
+    def poll(self):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            latest = self._latest(cursor)
+            if self.seq is None or latest <= self.seq:
+                self.seq = latest
+                return
+            changes = self._changes(cursor, latest)
+            self.seq = latest
+        finally:
+            conn.close()
+        self._on_change(changes)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Change watcher poll failed: {str(e)}")
+
+    def start(self):
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name='change-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stopped.set()
+        if wait and self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict, defaultdict
+from itertools import groupby
+
+GET_DUTIES_ON_DATE = "SELECT id, ra_id, shift FROM duties WHERE date = ?"
+GET_DUTIES_IN_RANGE = "SELECT id, date, ra_id, shift FROM duties WHERE date >= ? AND date <= ?"
+SCAN_DUTIES_BY_DATE = """
+    SELECT d.id, d.ra_id, r.name, d.date, d.shift
+    FROM duties d LEFT JOIN ras r ON r.id = d.ra_id
+    WHERE d.date >= ? AND d.date <= ?
+    ORDER BY d.date, d.id
+"""
+
+
+class OccupancyIndex:
+    """In-memory map of date -> {duty id: (ra_id, shift)} for write-path conflict checks
+
+    Dates are loaded from the database on first use (one indexed query) and
+    kept in a bounded LRU. Writers keep loaded dates current with add() and
+    remove(). The unique (date, shift) index stays the final guard against
+    duplicate shifts written by other processes.
+    """
+
+    def __init__(self, connect, max_dates=4096):
+        self._connect = connect
+        self._max_dates = max_dates
+        self._lock = threading.Lock()
+        self._dates = OrderedDict()
+
+    def _remember(self, day, duties):
+        self._dates[day] = duties
+        self._dates.move_to_end(day)
+        while len(self._dates) > self._max_dates:
+            self._dates.popitem(last=False)
+
+    def _duties_on(self, day):
+        with self._lock:
+            if day in self._dates:
+                self._dates.move_to_end(day)
+                return dict(self._dates[day])
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(GET_DUTIES_ON_DATE, (day,)).fetchall()
+        finally:
+            conn.close()
+        duties = {duty_id: (ra_id, shift) for duty_id, ra_id, shift in rows}
+
+        with self._lock:
+            self._remember(day, duties)
+        return dict(duties)
+
+    def preload(self, start, end):
+        """Load every date in [start, end] with one range query"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(GET_DUTIES_IN_RANGE, (start, end)).fetchall()
+        finally:
+            conn.close()
+        by_date = defaultdict(dict)
+        for duty_id, day, ra_id, shift in rows:
+            by_date[day][duty_id] = (ra_id, shift)
+        with self._lock:
+            for day, duties in by_date.items():
+                self._remember(day, duties)
+
+    def check(self, day, shift, ra_id, exclude_id=None):
+        """Return the conflicts a duty would create; an empty list means it is free"""
+        conflicts = []
+        for duty_id, (other_ra_id, other_shift) in self._duties_on(day).items():
+            if duty_id == exclude_id:
+                continue
+            if other_shift == shift:
+                conflicts.append({"type": "duplicate_shift", "duty_id": duty_id, "date": day, "shift": shift})
+            elif other_ra_id == ra_id:
+                conflicts.append({"type": "double_booked", "duty_id": duty_id, "date": day, "ra_id": ra_id})
+        return conflicts
+
+    def add(self, duty_id, day, ra_id, shift):
+        with self._lock:
+            if day in self._dates:
+                self._dates[day][duty_id] = (ra_id, shift)
+
+    def remove(self, duty_id, day):
+        with self._lock:
+            if day in self._dates:
+                self._dates[day].pop(duty_id, None)
+
+    def remove_ra(self, ra_id):
+        """Forget every loaded duty of an RA (deleting an RA cascades to its duties)"""
+        with self._lock:
+            for duties in self._dates.values():
+                for duty_id in [duty_id for duty_id, (other_ra_id, _) in duties.items() if other_ra_id == ra_id]:
+                    del duties[duty_id]
+
+    def invalidate(self):
+        with self._lock:
+            self._dates.clear()
+
+
+def find_conflicts(cursor, start, end):
+    """Find duplicate shifts and double-booked RAs in one ordered pass over duties
+
+    Rows are read in date order through idx_duties_date and only one day is
+    held in memory at a time.
+    """
+    cursor.execute(SCAN_DUTIES_BY_DATE, (start, end))
+    conflicts = []
+    for day, rows in groupby(cursor, key=lambda row: row[3]):
+        by_shift = defaultdict(list)
+        by_ra = defaultdict(list)
+        for duty_id, ra_id, ra_name, _, shift in rows:
+            by_shift[shift].append(duty_id)
+            by_ra[(ra_id, ra_name)].append(duty_id)
+
+        for shift, duty_ids in by_shift.items():
+            if len(duty_ids) > 1:
+                conflicts.append({"type": "duplicate_shift", "date": day, "shift": shift, "duty_ids": duty_ids})
+        for (ra_id, ra_name), duty_ids in by_ra.items():
+            if len(duty_ids) > 1:
+                conflicts.append({
+                    "type": "double_booked", "date": day, "ra_id": ra_id,
+                    "ra_name": ra_name, "duty_ids": duty_ids
+                })
+    return conflicts
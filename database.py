@@ -0,0 +1,242 @@
+import sqlite3
+import threading
+import time
+
+# Pragmas applied once to every new connection. journal_mode=WAL is persistent
+# in the database file, the rest are per-connection settings.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement and its time to the pool's query hook
+
+    SQLite computes most result rows lazily while they are fetched, so the
+    time spent in fetchone()/fetchmany()/fetchall() and iteration counts
+    towards the statement too. A statement is reported once its rows are
+    exhausted, or when the cursor runs the next statement or is closed.
+    """
+
+    _sql = None
+    _elapsed = 0.0
+
+    def _hook(self):
+        return self.connection.pool.query_hook if self.connection.pool else None
+
+    def _report(self):
+        sql, self._sql = self._sql, None
+        if sql is not None:
+            hook = self._hook()
+            if hook is not None:
+                hook(sql, self._elapsed)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def _run(self, method, sql, parameters):
+        self._report()
+        if self._hook() is None:
+            return method(sql, parameters)
+        self._sql, self._elapsed = sql, 0.0
+        try:
+            self._timed(method, sql, parameters)
+        except BaseException:
+            self._report()
+            raise
+        # Statements without a result set are done once they have run
+        if self.description is None:
+            self._report()
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        if self._sql is None:
+            return super().fetchone()
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._report()
+        return row
+
+    def fetchmany(self, size=None):
+        if self._sql is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._report()
+        return rows
+
+    def fetchall(self):
+        if self._sql is None:
+            return super().fetchall()
+        try:
+            return self._timed(super().fetchall)
+        finally:
+            self._report()
+
+    def __next__(self):
+        if self._sql is None:
+            return super().__next__()
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._report()
+            raise
+
+    def close(self):
+        self._report()
+        super().close()
+
+    def __del__(self):
+        # Cursors left with unread rows (conn.execute(...).fetchone()) report when collected
+        self._report()
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool
+
+    Cursors, including the ones SQLAlchemy opens, are TimedCursors so the
+    pool's query hook sees raw and ORM statements alike.
+    """
+
+    pool = None
+    depth = 0
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() bypasses Python-level cursor methods, so route it explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Shared pool of SQLite connections for both raw sqlite3 and SQLAlchemy access
+
+    A thread that asks for a connection while it already holds one gets the same
+    connection back, so nested helpers and the ORM session share one transaction
+    instead of locking each other out. Released connections are kept idle and
+    handed to the next thread rather than being closed.
+    """
+
+    def __init__(self, path, max_idle=16, busy_timeout=5.0):
+        self.path = path
+        self.max_idle = max_idle
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._idle = []
+        self.created = 0
+        self.in_use = 0
+        # Optional callable(sql, seconds) invoked once per statement, fetches included
+        self.query_hook = None
+
+    def _create(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            factory=PooledConnection
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def connect(self):
+        """Return this thread's connection, reusing an idle one if possible"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._create()
+            with self._lock:
+                self.in_use += 1
+            self._local.conn = conn
+        conn.depth += 1
+        # Every checkout starts with plain tuples, even if an earlier holder
+        # set sqlite3.Row and never released the connection
+        conn.row_factory = None
+        return conn
+
+    def release(self, conn):
+        """Give a connection back; the outermost release returns it to the idle list"""
+        if conn.depth <= 0:
+            # Already returned, e.g. by release_thread()
+            return
+        conn.depth -= 1
+        if conn.depth > 0:
+            return
+
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.conn = None
+
+        with self._lock:
+            self.in_use -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.really_close()
+
+    def release_thread(self):
+        """Return this thread's connection to the pool however often it is checked out
+
+        Request teardown calls this so a handler that raised before close()
+        cannot keep its connection, or its open transaction, for good.
+        Returns True if a connection was still checked out.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return False
+        conn.depth = 1
+        self.release(conn)
+        return True
+
+    def dispose(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.really_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': self.created,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'max_idle': self.max_idle
+            }
@@ -0,0 +1,139 @@
+import json
+import threading
+from collections import deque
+
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_MAX_SUBSCRIBERS = 500
+HEARTBEAT_SECONDS = 15
+
+
+class Subscriber:
+    """One listener's bounded event queue
+
+    When a slow consumer lets the queue fill up, the queued events are
+    dropped and replaced by a single overflow flag; the client is then told
+    to resync instead of receiving a partial backlog.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.queue = deque()
+        self.overflowed = False
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def push(self, event):
+        with self.condition:
+            if self.overflowed:
+                return
+            if len(self.queue) >= self.maxsize:
+                self.queue.clear()
+                self.overflowed = True
+            else:
+                self.queue.append(event)
+            self.condition.notify()
+
+    def close(self):
+        """Wake the listener and end its stream"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds for events; returns (events, overflowed)"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.queue or self.overflowed or self.closed, timeout)
+            events = list(self.queue)
+            overflowed = self.overflowed
+            self.queue.clear()
+            self.overflowed = False
+        return events, overflowed
+
+
+class EventHub:
+    """In-process publish/subscribe hub for duty and RA change events"""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, max_subscribers=DEFAULT_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._last_id = 0
+        self._closed = False
+        self._listeners = []
+
+    def subscribe(self):
+        """Register a new subscriber, or return None when the hub is full or closed"""
+        with self._lock:
+            if self._closed or len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(self.queue_size)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def add_listener(self, callback):
+        """Call callback(event_type, data) in the publishing thread for every event
+
+        For in-process caches that must be invalidated before the writer's
+        response goes out; callbacks should be quick and must not raise.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def publish(self, event_type, data):
+        """Send an event to every subscriber; never blocks on slow consumers"""
+        with self._lock:
+            self._last_id += 1
+            event = (self._last_id, event_type, data)
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(event_type, data)
+        for subscriber in subscribers:
+            subscriber.push(event)
+
+    def close(self):
+        """End every open stream and refuse new subscribers, for server shutdown"""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(event_type, data, event_id=None):
+    """Encode one server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_stream(hub, subscriber, heartbeat=HEARTBEAT_SECONDS):
+    """Generator of server-sent events for one subscriber
+
+    The thread sleeps on the subscriber's condition between events, waking
+    only for new events or for a keep-alive comment every heartbeat seconds.
+    """
+    try:
+        yield "retry: 3000\n\n"
+        while not subscriber.closed:
+            events, overflowed = subscriber.drain(heartbeat)
+            if overflowed:
+                yield format_sse('resync', {})
+            elif events:
+                yield ''.join(format_sse(event_type, data, event_id) for event_id, event_type, data in events)
+            else:
+                yield ": keep-alive\n\n"
+    finally:
+        hub.unsubscribe(subscriber)
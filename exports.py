@@ -0,0 +1,320 @@
+import csv
+import hashlib
+import io
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ics': 'text/calendar; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Columns of the CSV and XLSX exports, in order; archive exports add 'archived'
+EXPORT_COLUMNS = ('id', 'ra_id', 'ra_name', 'date', 'shift', 'notes', 'created_at')
+
+PRODID = '-//RA Duty Tracker//Duty Schedule//EN'
+
+# Per-RA feed query: the RA's duties in date order from idx_duties_ra_date
+GET_RA_FEED = """
+    SELECT d.id, d.ra_id, r.name AS ra_name, d.date, d.shift, d.notes, d.created_at
+    FROM {source} d JOIN ras r ON r.id = d.ra_id
+    WHERE d.ra_id = ? {date_filters}
+    ORDER BY d.date, d.id
+"""
+
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Characters XML 1.0 does not allow, even escaped
+INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def stream_csv(columns, batches):
+    """CSV with a header row, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([_csv_cell(row[column]) for column in columns] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _ics_text(value):
+    """Escape a TEXT value (RFC 5545 3.3.11)"""
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n'))
+
+
+def _fold(line):
+    """Fold a content line into 75-octet pieces (RFC 5545 3.1) without splitting characters"""
+    if len(line) <= 75 and line.isascii():
+        return line + '\r\n'
+    pieces = []
+    current = ''
+    size = 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        # Continuation lines start with a space, which counts towards their 75
+        if size + width > (75 if not pieces else 74):
+            pieces.append(current)
+            current = ''
+            size = 0
+        current += char
+        size += width
+    pieces.append(current)
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+@lru_cache(maxsize=4096)
+def _ics_timestamp(value):
+    """created_at ('YYYY-MM-DD HH:MM:SS', UTC) as an iCalendar UTC date-time"""
+    try:
+        stamp = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        stamp = datetime.now(timezone.utc)
+    return stamp.strftime('%Y%m%dT%H%M%SZ')
+
+
+@lru_cache(maxsize=4096)
+def _ics_day(value):
+    """DTSTART/DTEND lines of an all-day event on a YYYY-MM-DD date"""
+    day = date.fromisoformat(value)
+    return (f"DTSTART;VALUE=DATE:{day.strftime('%Y%m%d')}\r\n"
+            f"DTEND;VALUE=DATE:{(day + timedelta(days=1)).strftime('%Y%m%d')}\r\n")
+
+
+def ics_event(duty, building):
+    """One all-day VEVENT for a duty; UIDs stay stable across exports and updates"""
+    summary = f"{duty['shift']} duty: {duty['ra_name'] or 'Unassigned'}"
+    # Schedules repeat a few hundred dates and creation times, so those lines are cached
+    event = (
+        'BEGIN:VEVENT\r\n'
+        + _fold(f"UID:duty-{duty['id']}@{building}.ra-duty-tracker")
+        + f"DTSTAMP:{_ics_timestamp(duty['created_at'])}\r\n"
+        + _ics_day(duty['date'])
+        + _fold(f"SUMMARY:{_ics_text(summary)}")
+    )
+    if duty['notes']:
+        event += _fold(f"DESCRIPTION:{_ics_text(duty['notes'])}")
+    # Duty days should not show the RA as busy in scheduling assistants
+    return event + 'TRANSP:TRANSPARENT\r\nEND:VEVENT\r\n'
+
+
+def stream_ics(batches, calendar_name, building):
+    """An iCalendar feed, one chunk per batch"""
+    yield ''.join(_fold(line) for line in (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH', f'X-WR-CALNAME:{_ics_text(calendar_name)}',
+    ))
+    for batch in batches:
+        yield ''.join(ics_event(duty, building) for duty in batch)
+    yield 'END:VCALENDAR\r\n'
+
+
+# The fixed parts of a one-sheet workbook; cells use inline strings, so no
+# shared string table (which would need every value up front) is written
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Duties" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+XLSX_SHEET = 'xl/worksheets/sheet1.xml'
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+
+class _ChunkWriter:
+    """Write-only file that hands its bytes over on take()
+
+    It has no tell() or seek(), so zipfile writes entries with data
+    descriptors instead of going back to patch local headers, which is what
+    lets the archive be sent while it is being written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+@lru_cache(maxsize=4096)
+def _xlsx_text(value):
+    # Names, shifts and dates repeat on most rows
+    text = escape(INVALID_XML.sub('', value))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_cell(value):
+    # Cell references are optional; cells without one fill the row left to right
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    return _xlsx_text(str(value))
+
+
+def _xlsx_row(number, values):
+    return f'<row r="{number}">{"".join(map(_xlsx_cell, values))}</row>'
+
+
+def stream_xlsx(columns, batches):
+    """A one-sheet XLSX workbook, deflated and sent one chunk per batch"""
+    out = _ChunkWriter()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open(XLSX_SHEET, 'w') as sheet:
+            sheet.write((SHEET_START + _xlsx_row(1, columns)).encode())
+            number = 1
+            for batch in batches:
+                rows = []
+                for row in batch:
+                    number += 1
+                    rows.append(_xlsx_row(number, [row[column] for column in columns]))
+                sheet.write(''.join(rows).encode())
+                yield out.take()
+            sheet.write(SHEET_END.encode())
+    yield out.take()
+
+
+def read_ra_feed(cursor, ra_id, start_date='', end_date='', include_archive=False):
+    """One RA's duties, oldest first, as dicts"""
+    date_filters = ""
+    params = [ra_id]
+    if start_date:
+        date_filters += " AND d.date >= ?"
+        params.append(start_date)
+    if end_date:
+        date_filters += " AND d.date <= ?"
+        params.append(end_date)
+    source = 'duty_history' if include_archive else 'duties'
+    cursor.execute(GET_RA_FEED.format(source=source, date_filters=date_filters), params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class FeedCache:
+    """LRU of rendered per-RA iCalendar feeds, dropped only when that RA's duties change
+
+    Calendar clients poll feeds constantly, so each feed is rendered once
+    and kept, with a content ETag, until the event hub reports a write to
+    one of the RA's duties or to the RA itself. Bulk imports clear
+    everything. A generation counter keeps a feed that was being rendered
+    while a write landed from being stored.
+    """
+
+    def __init__(self, max_feeds=256):
+        self.max_feeds = max_feeds
+        self._lock = threading.Lock()
+        self._feeds = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """(body, etag) for key, whose first item is the RA id; render() builds the body"""
+        with self._lock:
+            if key in self._feeds:
+                self.hits += 1
+                self._feeds.move_to_end(key)
+                return self._feeds[key]
+            self.misses += 1
+            generation = self._generation
+
+        body = render().encode('utf-8')
+        feed = (body, hashlib.sha1(body).hexdigest()[:16])
+
+        with self._lock:
+            if generation == self._generation:
+                self._feeds[key] = feed
+                while len(self._feeds) > self.max_feeds:
+                    self._feeds.popitem(last=False)
+        return feed
+
+    def invalidate_ras(self, ra_ids):
+        ra_ids = set(ra_ids)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._feeds if key[0] in ra_ids]:
+                del self._feeds[key]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._feeds), 'hits': self.hits, 'misses': self.misses}
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._feeds.clear()
+
+    def handle_event(self, event_type, data):
+        """Event hub listener"""
+        if event_type in ('duty.created', 'duty.updated', 'duty.deleted'):
+            # A reassigned duty leaves its previous RA's feed too
+            self.invalidate_ras([data.get('ra_id'), data.get('previous_ra_id')])
+        elif event_type in ('ra.updated', 'ra.deleted'):
+            self.invalidate_ras([data.get('id')])
+        elif event_type == 'duties.imported':
+            self.invalidate()
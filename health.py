@@ -0,0 +1,41 @@
+import os
+
+# Every read below is a primary-key lookup, a read of a small counter table
+# (one row per month for duties) or a PRAGMA answered from the file header
+READ_ROW_COUNTS = "SELECT table_name, row_count FROM row_counts"
+READ_DUTY_COUNT = "SELECT COALESCE(SUM(total_duties), 0) FROM monthly_duty_counts"
+# change_log.seq is an INTEGER PRIMARY KEY, so each MIN/MAX is one b-tree seek
+# (SQLite only does that for a lone MIN or MAX, hence the two subqueries)
+READ_CHANGE_LOG_RANGE = "SELECT (SELECT MIN(seq) FROM change_log), (SELECT MAX(seq) FROM change_log)"
+PAGE_PRAGMAS = ('page_size', 'page_count', 'freelist_count', 'cache_size', 'mmap_size', 'user_version')
+
+
+def read_row_counts(cursor):
+    """Row counts of the main tables from the maintained counters"""
+    cursor.execute(READ_ROW_COUNTS)
+    counts = dict(cursor.fetchall())
+    cursor.execute(READ_DUTY_COUNT)
+    counts['duties'] = cursor.fetchone()[0]
+    cursor.execute(READ_CHANGE_LOG_RANGE)
+    first, last = cursor.fetchone()
+    counts['change_log_seq'] = {'first': first, 'last': last}
+    return counts
+
+
+def read_page_stats(cursor):
+    stats = {}
+    for pragma in PAGE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+        stats[pragma] = cursor.fetchone()[0]
+    return stats
+
+
+def file_sizes(path):
+    """Sizes in bytes of the database file and its WAL and shared-memory files (0 if absent)"""
+    sizes = {}
+    for name, suffix in (('database_bytes', ''), ('wal_bytes', '-wal'), ('shm_bytes', '-shm')):
+        try:
+            sizes[name] = os.path.getsize(path + suffix)
+        except OSError:
+            sizes[name] = 0
+    return sizes
@@ -0,0 +1,75 @@
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request
+
+from shards import BUILDING_HEADER
+
+READ_DATA_VERSION = "SELECT version, updated_at FROM data_version WHERE id = 1"
+
+
+def read_data_version(connect):
+    """Return (version, last modified datetime) of the duty and RA data
+
+    HTTP dates have whole seconds, so the time is rounded up: a later write
+    never ends up with an earlier Last-Modified than the one a client holds.
+    """
+    conn = connect()
+    try:
+        version, updated_at = conn.execute(READ_DATA_VERSION).fetchone()
+    finally:
+        conn.close()
+    return version, datetime.fromtimestamp(math.ceil(updated_at), timezone.utc)
+
+
+def conditional(connect):
+    """Decorator adding ETag/Last-Modified headers and 304 responses to a GET view
+
+    The ETag combines the data version with the request path and query
+    string, so each filtered representation has its own tag. The version is
+    read before the view runs; a write that lands in between only makes the
+    tag older than the body, which costs the client one extra full fetch.
+
+    Last-Modified is only sent, and If-Modified-Since only honored, once the
+    second it names has passed: until then another write could land in the
+    same second and be hidden behind a 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            checked_at = time.time()
+            version, last_modified = read_data_version(connect)
+            settled = last_modified.timestamp() <= checked_at
+            # Buildings have separate databases whose versions can coincide
+            building = request.headers.get(BUILDING_HEADER, '')
+            digest = hashlib.sha1(f"{building}|{request.full_path}".encode()).hexdigest()[:16]
+            etag = f"{version}-{digest}"
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = (
+                    settled and
+                    request.if_modified_since is not None and
+                    last_modified <= request.if_modified_since
+                )
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.vary.add(BUILDING_HEADER)
+            if settled:
+                response.last_modified = last_modified
+            # Let browsers keep the body but always revalidate it
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
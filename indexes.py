@@ -0,0 +1,39 @@
+import re
+
+# Indexes the duty queries are planned against, created by the migrations: (name, table, indexed columns)
+MANAGED_INDEXES = (
+    # Date range filters and ORDER BY date (entries are ordered by date, then id)
+    ('idx_duties_date', 'duties', 'date'),
+    # Per-RA lookups, the ra_duty_summary join and the RA deletion trigger's COUNT(*)
+    ('idx_duties_ra_date', 'duties', 'ra_id, date'),
+    # Shift-type filters within a date range
+    ('idx_duties_shift_date', 'duties', 'shift, date'),
+)
+
+# A plan line such as "SCAN duties" (no index) means a full table scan
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def explain_query_plan(cursor, query):
+    """Return the EXPLAIN QUERY PLAN detail lines for a query"""
+    params = [None] * query.count('?')
+    cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+    return [row[-1] for row in cursor.fetchall()]
+
+
+def find_full_scans(cursor, statements, allowed=()):
+    """Check every SQL string attribute of a statements class for full table scans
+
+    Templated statements are planned with their optional clauses left empty.
+    Statements named in `allowed` read whole tables on purpose and are skipped.
+    Returns a list of (statement name, plan line) for each offending plan step.
+    """
+    failures = []
+    for name, query in vars(statements).items():
+        if name.startswith('_') or name in allowed or not isinstance(query, str):
+            continue
+        query = re.sub(r'\{\w+\}', '', query)
+        for line in explain_query_plan(cursor, query):
+            if FULL_SCAN.match(line.strip()):
+                failures.append((name, line.strip()))
+    return failures
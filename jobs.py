@@ -0,0 +1,320 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+DEFAULT_JOB_THREADS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+# Retries wait 30s, 60s, 120s, ... after a failure
+RETRY_BASE_SECONDS = 30
+# A running job whose lease runs out (its worker died) is run again
+LEASE_SECONDS = 2 * 60
+# Running jobs renew their lease this often, however long they take
+HEARTBEAT_SECONDS = 30
+POLL_SECONDS = 1.0
+# Schedules are read at most this often, so idle workers rarely touch the database
+SCHEDULE_CHECK_SECONDS = 30.0
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+# Claims are read-only until a job is due, so polling never takes the write lock
+HAS_DUE_JOB = """
+    SELECT 1 FROM jobs
+    WHERE (status = 'queued' AND run_after <= :now) OR (status = 'running' AND lease_until < :now)
+    LIMIT 1
+"""
+CLAIM_JOB = """
+    UPDATE jobs
+    SET status = 'running', attempts = attempts + 1, started_at = :now,
+        lease_until = :lease_until, worker = :worker
+    WHERE id = COALESCE(
+        (SELECT id FROM jobs WHERE status = 'queued' AND run_after <= :now ORDER BY run_after, id LIMIT 1),
+        (SELECT id FROM jobs WHERE status = 'running' AND lease_until < :now ORDER BY lease_until LIMIT 1)
+    )
+    RETURNING id, type, params, attempts, max_attempts
+"""
+INSERT_JOB = """
+    INSERT INTO jobs (type, params, max_attempts, run_after, created_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+# Only the claim that is still running may extend its lease
+RENEW_LEASE = """
+    UPDATE jobs SET lease_until = ?
+    WHERE id = ? AND status = 'running' AND worker = ? AND attempts = ?
+"""
+FINISH_JOB = """
+    UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL
+    WHERE id = ?
+"""
+RETRY_JOB = """
+    UPDATE jobs SET status = 'queued', error = ?, run_after = ?, lease_until = NULL
+    WHERE id = ?
+"""
+JOB_COLUMNS = "id, type, status, attempts, max_attempts, result, error, run_after, created_at, started_at, finished_at"
+GET_JOB = f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?"
+LIST_JOBS = f"SELECT {JOB_COLUMNS} FROM jobs WHERE 1=1 {{status_filter}} ORDER BY id DESC LIMIT ?"
+PRUNE_JOBS = "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?"
+
+GET_SCHEDULES = "SELECT name, next_run_at FROM job_schedules"
+ADD_SCHEDULE = "INSERT OR IGNORE INTO job_schedules (name, next_run_at) VALUES (?, ?)"
+# Only one process wins the update for a due run, and only the winner enqueues it
+ADVANCE_SCHEDULE = "UPDATE job_schedules SET next_run_at = ? WHERE name = ? AND next_run_at <= ?"
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).isoformat(timespec='seconds')
+
+
+def _job_dict(columns, row):
+    job = dict(zip(columns, row))
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    for column in ('run_after', 'created_at', 'started_at', 'finished_at'):
+        job[column] = _timestamp(job[column])
+    return job
+
+
+def enqueue(conn, job_type, params=None, max_attempts=DEFAULT_MAX_ATTEMPTS, delay=0.0):
+    """Queue a job and commit; returns its id"""
+    now = time.time()
+    cursor = conn.cursor()
+    cursor.execute(INSERT_JOB, (job_type, json.dumps(params or {}), max_attempts, now + delay, now))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def get_job(cursor, job_id):
+    """A job's status as a JSON-ready dict, or None"""
+    cursor.execute(GET_JOB, (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return _job_dict([column[0] for column in cursor.description], row)
+
+
+def list_jobs(cursor, status=None, limit=50):
+    """Most recent jobs first, optionally only those with one status"""
+    status_filter = ""
+    params = []
+    if status:
+        if status not in JOB_STATUSES:
+            raise ValueError(f"status must be one of {', '.join(JOB_STATUSES)}")
+        status_filter = " AND status = ?"
+        params.append(status)
+    cursor.execute(LIST_JOBS.format(status_filter=status_filter), params + [limit])
+    columns = [column[0] for column in cursor.description]
+    return [_job_dict(columns, row) for row in cursor.fetchall()]
+
+
+def prune_jobs(cursor, keep_days):
+    """Delete finished jobs older than keep_days; returns how many were removed"""
+    cursor.execute(PRUNE_JOBS, (time.time() - keep_days * 86400,))
+    return cursor.rowcount
+
+
+class JobRunner:
+    """Runs queued jobs of every building on a small thread pool
+
+    Jobs live in each building's jobs table, so they survive restarts and any
+    number of worker processes can share a queue: claiming a job is a single
+    UPDATE ... RETURNING under SQLite's write lock. A claimed job holds a
+    lease that a heartbeat renews while the handler runs; if its process
+    dies the job is claimed again once the lease runs out. Failed jobs are
+    retried with exponential backoff up to their max_attempts, except that
+    a ValueError (bad parameters) fails them at once.
+
+    Handlers are called as handler(shard, params) and return a JSON-ready
+    result. Scheduled jobs are enqueued per building by whichever process
+    first sees they are due.
+    """
+
+    def __init__(self, shards, threads=DEFAULT_JOB_THREADS, poll_seconds=POLL_SECONDS):
+        self._shards = shards
+        self.threads = threads
+        self.poll_seconds = poll_seconds
+        self.handlers = {}
+        self.schedules = {}
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._slots = threading.Semaphore(threads)
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._thread = None
+        self._next_schedule_check = 0.0
+
+    def register(self, job_type, handler, max_attempts=DEFAULT_MAX_ATTEMPTS, validate=None):
+        """Add a job type; validate(params) raises ValueError for bad parameters before they are queued"""
+        self.handlers[job_type] = (handler, max_attempts, validate)
+
+    def schedule(self, job_type, every_seconds, params=None):
+        """Run job_type in every building every `every_seconds`"""
+        self.schedules[f"{job_type}:{every_seconds}"] = (job_type, every_seconds, params or {})
+
+    def submit(self, shard, job_type, params=None, delay=0.0):
+        """Validate and queue a job in a building; returns its id. Raises ValueError."""
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type '{job_type}'; expected one of {', '.join(sorted(self.handlers))}")
+        _, max_attempts, validate = self.handlers[job_type]
+        params = params or {}
+        if validate is not None:
+            validate(params)
+        conn = shard.connect()
+        try:
+            job_id = enqueue(conn, job_type, params, max_attempts, delay)
+        finally:
+            conn.close()
+        self._wake.set()
+        return job_id
+
+    def start(self):
+        """Start the dispatcher; safe to call from every request, only the first call does anything"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='job')
+            self._thread = threading.Thread(target=self._run, name='job-dispatcher', daemon=True)
+            self._thread.start()
+
+    def request_stop(self):
+        """Stop claiming jobs without waiting for anything, e.g. from a signal handler"""
+        self._stopped.set()
+        self._wake.set()
+
+    def stop(self, wait=True):
+        """Stop claiming jobs; running jobs finish unless wait is False, in which case their leases expire"""
+        if self._thread is None:
+            return
+        self.request_stop()
+        self._thread.join()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        with self._lock:
+            self._thread = None
+            self._executor = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Job dispatcher failed: {str(e)}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def run_pending(self, executor=None):
+        """Enqueue due scheduled jobs and hand due jobs to the pool while it has free threads"""
+        executor = executor or self._executor
+        check_schedules = time.time() >= self._next_schedule_check
+        if check_schedules:
+            self._next_schedule_check = time.time() + SCHEDULE_CHECK_SECONDS
+        for shard in self._shards():
+            if check_schedules:
+                self._enqueue_scheduled(shard)
+            while not self._stopped.is_set() and self._slots.acquire(blocking=False):
+                job = self._claim(shard)
+                if job is None:
+                    self._slots.release()
+                    break
+                executor.submit(self._execute, shard, job)
+
+    def _enqueue_scheduled(self, shard):
+        if not self.schedules:
+            return
+        now = time.time()
+        conn = shard.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(GET_SCHEDULES)
+            next_runs = dict(cursor.fetchall())
+            for name, (job_type, every_seconds, params) in self.schedules.items():
+                if name not in next_runs:
+                    # First run one interval from now rather than all at once on deploy
+                    cursor.execute(ADD_SCHEDULE, (name, now + every_seconds))
+                elif next_runs[name] <= now:
+                    cursor.execute(ADVANCE_SCHEDULE, (now + every_seconds, name, now))
+                    if cursor.rowcount:
+                        _, max_attempts, _ = self.handlers[job_type]
+                        cursor.execute(INSERT_JOB, (job_type, json.dumps(params), max_attempts, now, now))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _claim(self, shard):
+        now = time.time()
+        conn = shard.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(HAS_DUE_JOB, {'now': now})
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute(CLAIM_JOB, {'now': now, 'lease_until': now + LEASE_SECONDS, 'worker': self.worker})
+            row = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job_id, job_type, params, attempts, max_attempts = row
+        return {'id': job_id, 'type': job_type, 'params': json.loads(params),
+                'attempts': attempts, 'max_attempts': max_attempts}
+
+    def _execute(self, shard, job):
+        try:
+            self.run_job(shard, job)
+        except Exception as e:
+            print(f"Could not record the outcome of job {job['id']}: {str(e)}")
+        finally:
+            self._slots.release()
+
+    def run_job(self, shard, job):
+        """Run one claimed job and record its result, retry or failure"""
+        handler = self.handlers.get(job['type'], (None,))[0]
+        retry = False
+        finished = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(shard, job, finished),
+                         name=f"job-{job['id']}-heartbeat", daemon=True).start()
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job type '{job['type']}'")
+            if job['attempts'] > job['max_attempts']:
+                raise ValueError("Job did not finish within its lease")
+            result = handler(shard, job['params'])
+            status, error = 'succeeded', None
+        except Exception as e:
+            result = None
+            error = f"{type(e).__name__}: {str(e)}"
+            # Bad parameters fail the same way every time
+            retry = not isinstance(e, ValueError) and job['attempts'] < job['max_attempts']
+            status = 'failed'
+        finally:
+            finished.set()
+
+        conn = shard.connect()
+        try:
+            if retry:
+                delay = RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1)
+                conn.execute(RETRY_JOB, (error, time.time() + delay, job['id']))
+            else:
+                conn.execute(FINISH_JOB, (status, json.dumps(result), error, time.time(), job['id']))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _heartbeat(self, shard, job, finished):
+        """Keep extending a running job's lease until `finished` is set"""
+        while not finished.wait(HEARTBEAT_SECONDS):
+            conn = shard.connect()
+            try:
+                conn.execute(RENEW_LEASE, (time.time() + LEASE_SECONDS, job['id'], self.worker, job['attempts']))
+                conn.commit()
+            except sqlite3.Error as e:
+                # The job itself may hold the write lock; try again on the next beat
+                print(f"Could not renew the lease of job {job['id']}: {str(e)}")
+            finally:
+                conn.close()
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+from serialization import FastJSONProvider
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per label set"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (bucket_counts, total, count) in items:
+            base = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            prefix = base + ',' if base else ''
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+class Counter:
+    """Prometheus-style monotonically increasing counter"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self):
+        with self._lock:
+            self.value += 1
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+class RequestMetrics:
+    """Per-request timing, query counting and slow-query logging
+
+    init_app() installs before/after request hooks and a JSON provider that
+    times serialization; record_query() is meant to be the connection pool's
+    query hook, which sees both raw sqlite3 and SQLAlchemy statements.
+    """
+
+    def __init__(self, slow_query_ms=100):
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time spent handling a request',
+            ('endpoint', 'method', 'status'), LATENCY_BUCKETS
+        )
+        self.db_time = Histogram(
+            'db_time_per_request_seconds', 'Time spent executing SQL per request',
+            ('endpoint',), LATENCY_BUCKETS
+        )
+        self.query_count = Histogram(
+            'db_queries_per_request', 'SQL statements executed per request',
+            ('endpoint',), QUERY_COUNT_BUCKETS
+        )
+        self.serialization_time = Histogram(
+            'serialization_per_request_seconds', 'Time spent encoding JSON per request',
+            ('endpoint',), LATENCY_BUCKETS
+        )
+        self.slow_queries = Counter('db_slow_queries_total', 'SQL statements slower than the slow query threshold')
+
+    def init_app(self, app):
+        app.json = TimedJSONProvider(app, self)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+        g.serialization_time = 0.0
+
+    def _finish_request(self, response):
+        if 'request_started' not in g:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.request_duration.observe(
+            (endpoint, request.method, str(response.status_code)),
+            time.perf_counter() - g.request_started
+        )
+        self.db_time.observe((endpoint,), g.db_time)
+        self.query_count.observe((endpoint,), g.db_queries)
+        self.serialization_time.observe((endpoint,), g.serialization_time)
+        return response
+
+    def record_query(self, sql, seconds):
+        if has_request_context() and 'request_started' in g:
+            g.db_queries += 1
+            g.db_time += seconds
+        if seconds >= self.slow_query_seconds:
+            self.slow_queries.inc()
+            logger.warning("Slow query (%.1f ms): %s", seconds * 1000, ' '.join(sql.split()))
+
+    def record_serialization(self, seconds):
+        if has_request_context() and 'request_started' in g:
+            g.serialization_time += seconds
+
+    def render(self):
+        lines = []
+        for metric in (self.request_duration, self.db_time, self.query_count,
+                       self.serialization_time, self.slow_queries):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class TimedJSONProvider(FastJSONProvider):
+    """Flask JSON provider that reports encoding time to RequestMetrics"""
+
+    def __init__(self, app, metrics):
+        super().__init__(app)
+        self.metrics = metrics
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            self.metrics.record_serialization(time.perf_counter() - start)
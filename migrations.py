@@ -0,0 +1,729 @@
+import sqlite3
+from functools import partial
+
+
+class SchemaVersionError(RuntimeError):
+    """The database schema is not at the version this code expects"""
+
+
+# Every step spells out its DDL here rather than calling the helpers of the
+# modules that use these objects, so a fresh database still passes through
+# exactly the schema each later migration was written against
+
+BASELINE_RETIRED_INDEXES = (
+    'idx_duties_ra_id',
+    'idx_duties_shift',
+    'idx_duties_ra_name',
+    'idx_duties_date_shift',
+    'idx_ras_name',
+)
+
+BASELINE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_duties_date ON duties (date)",
+    "CREATE INDEX IF NOT EXISTS idx_duties_ra_date ON duties (ra_id, date)",
+    "CREATE INDEX IF NOT EXISTS idx_duties_shift_date ON duties (shift, date)",
+    "CREATE INDEX IF NOT EXISTS idx_duties_ra_name_shift ON duties (ra_name, shift)",
+)
+
+BASELINE_UNIQUE_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_ras_name_lower ON ras (lower(name))",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_duties_date_shift_unique ON duties (date, shift)",
+)
+
+BASELINE_SUMMARY_TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS ra_duty_counts (
+        ra_id INTEGER PRIMARY KEY,
+        total_duties INTEGER NOT NULL DEFAULT 0,
+        primary_count INTEGER NOT NULL DEFAULT 0,
+        secondary_count INTEGER NOT NULL DEFAULT 0,
+        tertiary_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS monthly_duty_counts (
+        year_month TEXT PRIMARY KEY,
+        total_duties INTEGER NOT NULL DEFAULT 0,
+        primary_count INTEGER NOT NULL DEFAULT 0,
+        secondary_count INTEGER NOT NULL DEFAULT 0,
+        tertiary_count INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''',
+)
+
+BASELINE_SUMMARY_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS duties_summary_after_insert
+    AFTER INSERT ON duties
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO ra_duty_counts (ra_id, total_duties, primary_count, secondary_count, tertiary_count)
+        SELECT NEW.ra_id, 1, NEW.shift = 'Primary', NEW.shift = 'Secondary', NEW.shift = 'Tertiary'
+        WHERE NEW.ra_id IS NOT NULL
+        ON CONFLICT (ra_id) DO UPDATE SET
+            total_duties = total_duties + excluded.total_duties,
+            primary_count = primary_count + excluded.primary_count,
+            secondary_count = secondary_count + excluded.secondary_count,
+            tertiary_count = tertiary_count + excluded.tertiary_count;
+        INSERT INTO monthly_duty_counts (year_month, total_duties, primary_count, secondary_count, tertiary_count)
+        SELECT strftime('%Y-%m', NEW.date), 1, NEW.shift = 'Primary', NEW.shift = 'Secondary', NEW.shift = 'Tertiary'
+        WHERE strftime('%Y-%m', NEW.date) IS NOT NULL
+        ON CONFLICT (year_month) DO UPDATE SET
+            total_duties = total_duties + excluded.total_duties,
+            primary_count = primary_count + excluded.primary_count,
+            secondary_count = secondary_count + excluded.secondary_count,
+            tertiary_count = tertiary_count + excluded.tertiary_count;
+    END;
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS duties_summary_after_update
+    AFTER UPDATE OF ra_id, date, shift ON duties
+    FOR EACH ROW
+    BEGIN
+        UPDATE ra_duty_counts SET
+            total_duties = total_duties - 1,
+            primary_count = primary_count - (OLD.shift = 'Primary'),
+            secondary_count = secondary_count - (OLD.shift = 'Secondary'),
+            tertiary_count = tertiary_count - (OLD.shift = 'Tertiary')
+        WHERE ra_id = OLD.ra_id;
+        DELETE FROM ra_duty_counts WHERE ra_id = OLD.ra_id AND total_duties <= 0;
+        INSERT INTO ra_duty_counts (ra_id, total_duties, primary_count, secondary_count, tertiary_count)
+        SELECT NEW.ra_id, 1, NEW.shift = 'Primary', NEW.shift = 'Secondary', NEW.shift = 'Tertiary'
+        WHERE NEW.ra_id IS NOT NULL
+        ON CONFLICT (ra_id) DO UPDATE SET
+            total_duties = total_duties + excluded.total_duties,
+            primary_count = primary_count + excluded.primary_count,
+            secondary_count = secondary_count + excluded.secondary_count,
+            tertiary_count = tertiary_count + excluded.tertiary_count;
+        UPDATE monthly_duty_counts SET
+            total_duties = total_duties - 1,
+            primary_count = primary_count - (OLD.shift = 'Primary'),
+            secondary_count = secondary_count - (OLD.shift = 'Secondary'),
+            tertiary_count = tertiary_count - (OLD.shift = 'Tertiary')
+        WHERE year_month = strftime('%Y-%m', OLD.date);
+        DELETE FROM monthly_duty_counts WHERE year_month = strftime('%Y-%m', OLD.date) AND total_duties <= 0;
+        INSERT INTO monthly_duty_counts (year_month, total_duties, primary_count, secondary_count, tertiary_count)
+        SELECT strftime('%Y-%m', NEW.date), 1, NEW.shift = 'Primary', NEW.shift = 'Secondary', NEW.shift = 'Tertiary'
+        WHERE strftime('%Y-%m', NEW.date) IS NOT NULL
+        ON CONFLICT (year_month) DO UPDATE SET
+            total_duties = total_duties + excluded.total_duties,
+            primary_count = primary_count + excluded.primary_count,
+            secondary_count = secondary_count + excluded.secondary_count,
+            tertiary_count = tertiary_count + excluded.tertiary_count;
+    END;
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS duties_summary_after_delete
+    AFTER DELETE ON duties
+    FOR EACH ROW
+    BEGIN
+        UPDATE ra_duty_counts SET
+            total_duties = total_duties - 1,
+            primary_count = primary_count - (OLD.shift = 'Primary'),
+            secondary_count = secondary_count - (OLD.shift = 'Secondary'),
+            tertiary_count = tertiary_count - (OLD.shift = 'Tertiary')
+        WHERE ra_id = OLD.ra_id;
+        DELETE FROM ra_duty_counts WHERE ra_id = OLD.ra_id AND total_duties <= 0;
+        UPDATE monthly_duty_counts SET
+            total_duties = total_duties - 1,
+            primary_count = primary_count - (OLD.shift = 'Primary'),
+            secondary_count = secondary_count - (OLD.shift = 'Secondary'),
+            tertiary_count = tertiary_count - (OLD.shift = 'Tertiary')
+        WHERE year_month = strftime('%Y-%m', OLD.date);
+        DELETE FROM monthly_duty_counts WHERE year_month = strftime('%Y-%m', OLD.date) AND total_duties <= 0;
+    END;
+    ''',
+    # Counter rows of a deleted RA are dropped with it
+    '''
+    CREATE TRIGGER IF NOT EXISTS ras_summary_after_delete
+    AFTER DELETE ON ras
+    FOR EACH ROW
+    BEGIN
+        DELETE FROM ra_duty_counts WHERE ra_id = OLD.id;
+    END;
+    ''',
+)
+
+BASELINE_SUMMARY_VIEWS = {
+    'ra_duty_summary': '''
+    CREATE VIEW ra_duty_summary AS
+    SELECT
+        r.id as ra_id,
+        r.name as ra_name,
+        COALESCE(c.total_duties, 0) as total_duties,
+        COALESCE(c.primary_count, 0) as primary_count,
+        COALESCE(c.secondary_count, 0) as secondary_count,
+        COALESCE(c.tertiary_count, 0) as tertiary_count
+    FROM ras r
+    LEFT JOIN ra_duty_counts c ON c.ra_id = r.id
+    ''',
+    'monthly_duty_summary': '''
+    CREATE VIEW monthly_duty_summary AS
+    SELECT year_month, total_duties, primary_count, secondary_count, tertiary_count
+    FROM monthly_duty_counts
+    ''',
+}
+
+BASELINE_SUMMARY_FILL = (
+    '''
+    INSERT INTO ra_duty_counts (ra_id, total_duties, primary_count, secondary_count, tertiary_count)
+    SELECT ra_id, COUNT(*),
+           SUM(CASE WHEN shift = 'Primary' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN shift = 'Secondary' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN shift = 'Tertiary' THEN 1 ELSE 0 END)
+    FROM duties
+    WHERE ra_id IS NOT NULL
+    GROUP BY 1
+    ''',
+    '''
+    INSERT INTO monthly_duty_counts (year_month, total_duties, primary_count, secondary_count, tertiary_count)
+    SELECT strftime('%Y-%m', date), COUNT(*),
+           SUM(CASE WHEN shift = 'Primary' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN shift = 'Secondary' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN shift = 'Tertiary' THEN 1 ELSE 0 END)
+    FROM duties
+    WHERE strftime('%Y-%m', date) IS NOT NULL
+    GROUP BY 1
+    ''',
+)
+
+# The tables whose writes the data version and the change log follow
+BASELINE_TRACKED_TABLES = (('duty', 'duties'), ('ra', 'ras'))
+
+
+def create_base_schema(cursor, sample_data=True):
+    """Tables, managed indexes and (optionally) sample data for an empty database"""
+    # Create tables if they don't exist
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ras (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS duties (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ra_id INTEGER NOT NULL,
+        ra_name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        shift TEXT NOT NULL,
+        notes TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (ra_id) REFERENCES ras (id) ON DELETE CASCADE
+    )
+    ''')
+
+    # Insert sample data if the database is empty
+    cursor.execute("SELECT COUNT(*) FROM ras")
+    if sample_data and cursor.fetchone()[0] == 0:
+        # Use prepared statement for inserting RAs
+        insert_ra_stmt = "INSERT INTO ras (id, name, email) VALUES (?, ?, ?)"
+        sample_ras = [
+            (1, "Alex Smith", "alex.smith@example.edu"),
+            (2, "Jordan Lee", "jordan.lee@example.edu"),
+            (3, "Taylor Wong", "taylor.wong@example.edu"),
+            (4, "Casey Johnson", "casey.johnson@example.edu")
+        ]
+        cursor.executemany(insert_ra_stmt, sample_ras)
+
+    cursor.execute("SELECT COUNT(*) FROM duties")
+    if sample_data and cursor.fetchone()[0] == 0:
+        # Use prepared statement for inserting duties
+        insert_duty_stmt = "INSERT INTO duties (id, ra_id, ra_name, date, shift, notes) VALUES (?, ?, ?, ?, ?, ?)"
+        sample_duties = [
+            (1, 1, "Alex Smith", "2025-03-28", "Secondary", "Main entrance duty"),
+            (2, 2, "Jordan Lee", "2025-03-29", "Tertiary", "Weekend patrol"),
+            (3, 3, "Taylor Wong", "2025-03-30", "Primary", "Mail room coverage"),
+            (4, 4, "Casey Johnson", "2025-04-01", "Secondary", "Front desk")
+        ]
+        cursor.executemany(insert_duty_stmt, sample_duties)
+
+    # Create the indexes on duties and ras
+    create_baseline_indexes(cursor)
+
+
+def create_baseline_indexes(cursor):
+    for name in BASELINE_RETIRED_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    for sql in BASELINE_INDEXES:
+        cursor.execute(sql)
+    for sql in BASELINE_UNIQUE_INDEXES:
+        try:
+            cursor.execute(sql)
+        except sqlite3.IntegrityError as e:
+            # Existing rows break the rule; stop here so the migration is retried once they are fixed
+            raise ValueError(f"Duplicate rows must be fixed first: {str(e)}")
+    cursor.execute("PRAGMA optimize")
+
+
+def create_summary_tables(cursor):
+    """Counter tables kept up to date by triggers, read through the summary views"""
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'ra_duty_counts'")
+    created = cursor.fetchone()[0] == 0
+
+    for sql in BASELINE_SUMMARY_TABLES + BASELINE_SUMMARY_TRIGGERS:
+        cursor.execute(sql)
+
+    # Replace the old aggregating views, but only when their definition changed
+    for name, sql in BASELINE_SUMMARY_VIEWS.items():
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ?", (name,))
+        row = cursor.fetchone()
+        if row is None or row[0].strip() != sql.strip():
+            cursor.execute(f"DROP VIEW IF EXISTS {name}")
+            cursor.execute(sql)
+
+    if created:
+        for sql in BASELINE_SUMMARY_FILL:
+            cursor.execute(sql)
+
+
+def create_data_version(cursor):
+    """Single-row counter bumped by every duty or RA write (ETags)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    INSERT OR IGNORE INTO data_version (id, version, updated_at)
+    VALUES (1, 1, (julianday('now') - 2440587.5) * 86400.0)
+    ''')
+
+    for _, table in BASELINE_TRACKED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_data_version_after_{event.lower()}
+            AFTER {event} ON {table}
+            FOR EACH ROW
+            BEGIN
+                UPDATE data_version
+                SET version = version + 1,
+                    updated_at = (julianday('now') - 2440587.5) * 86400.0
+                WHERE id = 1;
+            END;
+            ''')
+
+
+def create_change_log(cursor):
+    """Change log of duty and RA writes for delta sync (/api/changes)
+
+    When the table is first created every existing duty and RA is logged as
+    an insert, so a client syncing from 0 receives the complete data set.
+    """
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'change_log'")
+    created = cursor.fetchone()[0] == 0
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    for entity, table in BASELINE_TRACKED_TABLES:
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_change_log_after_{event.lower()}
+            AFTER {event} ON {table}
+            FOR EACH ROW
+            BEGIN
+                INSERT INTO change_log (entity, entity_id, op)
+                VALUES ('{entity}', {row}.id, '{event.lower()}');
+            END;
+            ''')
+
+    if created:
+        for entity, table in BASELINE_TRACKED_TABLES:
+            cursor.execute(
+                f"INSERT INTO change_log (entity, entity_id, op) SELECT '{entity}', id, 'insert' FROM {table} ORDER BY id"
+            )
+
+
+def create_stored_procedures(cursor):
+    """Create SQLite views and triggers to simulate stored procedures"""
+    # 1-2. Counter tables kept up to date by triggers on duties, read through the
+    # ra_duty_summary and monthly_duty_summary views
+    create_summary_tables(cursor)
+
+    # Data version counter bumped by triggers on every duty or RA write (ETags)
+    create_data_version(cursor)
+
+    # Change log of duty and RA writes for delta sync (/api/changes)
+    create_change_log(cursor)
+
+    # 3. Create a trigger to ensure duty ra_name matches the RA name in the ras table
+    # This acts like a stored procedure for write operations
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS ensure_duty_ra_name_consistency
+    AFTER INSERT ON duties
+    FOR EACH ROW
+    BEGIN
+        UPDATE duties
+        SET ra_name = (SELECT name FROM ras WHERE id = NEW.ra_id)
+        WHERE id = NEW.id AND ra_name != (SELECT name FROM ras WHERE id = NEW.ra_id);
+    END;
+    ''')
+
+    # 4. Create a trigger to prevent deletion of RAs with duties
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS prevent_ra_deletion_with_duties
+    BEFORE DELETE ON ras
+    FOR EACH ROW
+    BEGIN
+        SELECT CASE
+            WHEN (SELECT COUNT(*) FROM duties WHERE ra_id = OLD.id) > 0
+            THEN RAISE(ABORT, 'Cannot delete RA with assigned duties')
+        END;
+    END;
+    ''')
+
+
+def baseline(cursor, sample_data=True):
+    # Every statement is idempotent, so databases created before versioning
+    # (user_version 0) are brought up to version 1 without losing data
+    create_base_schema(cursor, sample_data)
+    create_stored_procedures(cursor)
+
+
+def drop_duty_ra_name(cursor):
+    """Normalize duties to store only ra_id; names are joined from ras when read"""
+    # Last chance to recover RAs that only exist as a name on their duties (what
+    # sync_ra_data() used to do); names that collide with an existing RA get the id
+    for name_expr in ("MIN(d.ra_name)", "MIN(d.ra_name) || ' (' || d.ra_id || ')'"):
+        cursor.execute(f'''
+        INSERT OR IGNORE INTO ras (id, name)
+        SELECT d.ra_id, {name_expr}
+        FROM duties d LEFT JOIN ras r ON r.id = d.ra_id
+        WHERE r.id IS NULL
+        GROUP BY d.ra_id
+        ''')
+
+    # The column can only be dropped once nothing in the schema refers to it
+    cursor.execute("DROP TRIGGER IF EXISTS ensure_duty_ra_name_consistency")
+    cursor.execute("DROP INDEX IF EXISTS idx_duties_ra_name_shift")
+    cursor.execute("ALTER TABLE duties DROP COLUMN ra_name")
+    cursor.execute("PRAGMA optimize")
+
+
+def type_duty_dates(cursor):
+    """Rebuild duties with CHECK constraints that keep date and created_at in ISO form"""
+    # Values SQLite can read are rewritten in canonical form ('2025-03-28 09:00' -> '2025-03-28')
+    cursor.execute("UPDATE duties SET date = date(date) WHERE date(date) IS NOT NULL AND date IS NOT date(date)")
+    cursor.execute('''
+    UPDATE duties SET created_at = datetime(created_at)
+    WHERE datetime(created_at) IS NOT NULL AND created_at IS NOT datetime(created_at)
+    ''')
+    cursor.execute('''
+    SELECT id, date, created_at FROM duties
+    WHERE date IS NOT date(date) OR (created_at IS NOT NULL AND created_at IS NOT datetime(created_at))
+    ORDER BY id LIMIT 20
+    ''')
+    invalid = cursor.fetchall()
+    if invalid:
+        listed = ', '.join(f"{duty_id} ({day!r}, {created!r})" for duty_id, day, created in invalid)
+        raise ValueError(f"Duties with dates that are not YYYY-MM-DD must be fixed first: {listed}")
+
+    # SQLite can't add a CHECK to an existing table, so copy into a new one and
+    # recreate the indexes and triggers from their saved definitions
+    cursor.execute('''
+    SELECT type, sql FROM sqlite_master
+    WHERE tbl_name = 'duties' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    ''')
+    dependents = cursor.fetchall()
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'duties'")
+    sequence = cursor.fetchone()
+
+    cursor.execute('''
+    CREATE TABLE duties_typed (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ra_id INTEGER NOT NULL,
+        date TEXT NOT NULL CHECK (date IS date(date)),
+        shift TEXT NOT NULL,
+        notes TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP CHECK (created_at IS datetime(created_at)),
+        FOREIGN KEY (ra_id) REFERENCES ras (id) ON DELETE CASCADE
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO duties_typed (id, ra_id, date, shift, notes, created_at)
+    SELECT id, ra_id, date, shift, notes, created_at FROM duties
+    ''')
+    cursor.execute("DROP TABLE duties")
+    # Triggers on ras still name duties; the legacy rename leaves them alone
+    # instead of failing on the table that is briefly missing
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute("ALTER TABLE duties_typed RENAME TO duties")
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+    for _, sql in dependents:
+        cursor.execute(sql)
+    # Keep AUTOINCREMENT from handing out ids of deleted or archived duties again
+    if sequence is not None:
+        cursor.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'duties'", sequence)
+    cursor.execute("PRAGMA optimize")
+
+
+def create_duty_archive(cursor):
+    """Cold partition for duties of past terms, and a view over both partitions"""
+    # Same columns as duties; ids are kept, so an archived duty is still found by its id
+    cursor.execute('''
+    CREATE TABLE duties_archive (
+        id INTEGER PRIMARY KEY,
+        ra_id INTEGER NOT NULL,
+        date TEXT NOT NULL CHECK (date IS date(date)),
+        shift TEXT NOT NULL,
+        notes TEXT,
+        created_at TEXT CHECK (created_at IS datetime(created_at)),
+        archived_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (ra_id) REFERENCES ras (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX idx_duties_archive_date ON duties_archive (date)")
+    cursor.execute("CREATE INDEX idx_duties_archive_ra_date ON duties_archive (ra_id, date)")
+
+    # History queries read both partitions; filters on d.date reach each side's index
+    cursor.execute('''
+    CREATE VIEW duty_history AS
+    SELECT id, ra_id, date, shift, notes, created_at, 0 AS archived FROM duties
+    UNION ALL
+    SELECT id, ra_id, date, shift, notes, created_at, 1 AS archived FROM duties_archive
+    ''')
+
+    # Archived duties still need their RA for names in history queries
+    cursor.execute('''
+    CREATE TRIGGER prevent_ra_deletion_with_archived_duties
+    BEFORE DELETE ON ras
+    FOR EACH ROW
+    WHEN EXISTS (SELECT 1 FROM duties_archive WHERE ra_id = OLD.id)
+    BEGIN
+        SELECT RAISE(ABORT, 'Cannot delete RA with assigned duties in the archive');
+    END;
+    ''')
+
+
+# External-content FTS5 indexes: the text stays in duties/ras and only the
+# inverted index is stored. Prefix indexes make 2- and 3-letter prefixes cheap.
+SEARCH_FTS_TABLES = {
+    'duties_fts': (
+        "CREATE VIRTUAL TABLE duties_fts USING fts5("
+        "notes, content='duties', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ),
+    'ras_fts': (
+        "CREATE VIRTUAL TABLE ras_fts USING fts5("
+        "name, content='ras', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ),
+}
+
+# (index, content table, indexed column) kept in sync by triggers
+SEARCH_FTS_SOURCES = (
+    ('duties_fts', 'duties', 'notes'),
+    ('ras_fts', 'ras', 'name'),
+)
+
+
+def create_search_index(cursor):
+    """FTS5 indexes over duty notes and RA names, filled and kept in sync by triggers"""
+    for name, sql in SEARCH_FTS_TABLES.items():
+        cursor.execute(sql)
+        # 'rebuild' reads every row of the content table into the index
+        cursor.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+
+    for index, table, column in SEARCH_FTS_SOURCES:
+        cursor.execute(f'''
+        CREATE TRIGGER {index}_after_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {index} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+        END;
+        ''')
+        # External content indexes are told the old text to remove it
+        cursor.execute(f'''
+        CREATE TRIGGER {index}_after_delete AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO {index} ({index}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+        END;
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER {index}_after_update AFTER UPDATE OF {column} ON {table}
+        BEGIN
+            INSERT INTO {index} ({index}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+            INSERT INTO {index} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+        END;
+        ''')
+
+
+# Tables whose row counts are kept in row_counts; duties are already counted
+# per month in monthly_duty_counts
+ROW_COUNTED_TABLES = ('ras', 'duties_archive')
+
+
+def create_row_counts(cursor):
+    """row_counts table seeded with one count per table, and the triggers that keep it"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS row_counts (
+        table_name TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    for table in ROW_COUNTED_TABLES:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO row_counts (table_name, row_count) SELECT '{table}', COUNT(*) FROM {table}"
+        )
+        for event, change in (('INSERT', '+ 1'), ('DELETE', '- 1')):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_row_count_after_{event.lower()}
+            AFTER {event} ON {table}
+            FOR EACH ROW
+            BEGIN
+                UPDATE row_counts SET row_count = row_count {change} WHERE table_name = '{table}';
+            END;
+            ''')
+
+
+def create_jobs_tables(cursor):
+    """Durable job queue and the table of scheduled job run times"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        params TEXT NOT NULL DEFAULT '{}',
+        status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        run_after REAL NOT NULL,
+        lease_until REAL,
+        worker TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS job_schedules (
+        name TEXT PRIMARY KEY,
+        next_run_at REAL NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
+def log_duty_keys(cursor):
+    """Record the dates and RAs of each logged duty change
+
+    Server workers evict only the calendar windows and ICS feeds a change
+    touched; an update also keeps the date and RA it moved away from.
+    """
+    for column in ('date TEXT', 'ra_id INTEGER', 'previous_date TEXT', 'previous_ra_id INTEGER'):
+        cursor.execute(f"ALTER TABLE change_log ADD COLUMN {column}")
+
+    for event in ('insert', 'update', 'delete'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS duties_change_log_after_{event}")
+    cursor.execute('''
+    CREATE TRIGGER duties_change_log_after_insert
+    AFTER INSERT ON duties
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO change_log (entity, entity_id, op, date, ra_id)
+        VALUES ('duty', NEW.id, 'insert', NEW.date, NEW.ra_id);
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER duties_change_log_after_update
+    AFTER UPDATE ON duties
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO change_log (entity, entity_id, op, date, ra_id, previous_date, previous_ra_id)
+        VALUES ('duty', NEW.id, 'update', NEW.date, NEW.ra_id, OLD.date, OLD.ra_id);
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER duties_change_log_after_delete
+    AFTER DELETE ON duties
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO change_log (entity, entity_id, op, date, ra_id)
+        VALUES ('duty', OLD.id, 'delete', OLD.date, OLD.ra_id);
+    END;
+    ''')
+
+
+# (version, description, function(cursor)); append new steps, never edit applied ones
+MIGRATIONS = (
+    (1, "Base tables, indexes, summary counters, data version and change log", baseline),
+    (2, "Drop the denormalized duties.ra_name column and its consistency trigger", drop_duty_ra_name),
+    (3, "Rebuild duties with CHECK constraints for ISO dates and timestamps", type_duty_dates),
+    (4, "Add the duties_archive partition and the duty_history view", create_duty_archive),
+    (5, "Add FTS5 search indexes over duty notes and RA names", create_search_index),
+    (6, "Add trigger-maintained row counts for RAs and archived duties", create_row_counts),
+    (7, "Add the durable background job queue and job schedules", create_jobs_tables),
+    (8, "Record duty dates and RA ids in the change log", log_duty_keys),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# For databases of new buildings, which start without the demo RAs and duties
+EMPTY_MIGRATIONS = tuple(
+    (version, description, partial(baseline, sample_data=False) if step is baseline else step)
+    for version, description, step in MIGRATIONS
+)
+
+
+def schema_version(cursor):
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply pending migrations, each in its own transaction
+
+    BEGIN IMMEDIATE takes the write lock before the version is read, so
+    concurrent runs queue up and the later ones find nothing left to do.
+    Returns the list of (version, description) pairs applied.
+    """
+    applied = []
+    cursor = conn.cursor()
+    for version, description, step in migrations:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(cursor) >= version:
+                conn.rollback()
+                continue
+            step(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+def check_schema(connect, building=None):
+    """Cheap startup check: one PRAGMA read, raises SchemaVersionError on a mismatch"""
+    conn = connect()
+    try:
+        version = schema_version(conn.cursor())
+    finally:
+        conn.close()
+    where = f"Database of building '{building}'" if building else "Database"
+    if version < SCHEMA_VERSION:
+        option = f" --building {building}" if building else ""
+        raise SchemaVersionError(
+            f"{where} schema is at version {version}, expected {SCHEMA_VERSION}; "
+            f"run 'flask --app app init-db{option}' first"
+        )
+    if version > SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"{where} schema version {version} is newer than this code ({SCHEMA_VERSION})"
+        )
+    return version
@@ -1,9 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy.orm import validates
+from datetime import date, datetime
 
 # Initialize SQLAlchemy instance
 db = SQLAlchemy()
 
+def iso_date(value, field='date'):
+    """Return value as a YYYY-MM-DD string, raising ValueError for anything else"""
+    text = str(value or '').strip()
+    try:
+        # fromisoformat() also takes forms like 20250328; only the canonical one is stored
+        if date.fromisoformat(text).isoformat() == text:
+            return text
+    except ValueError:
+        pass
+    raise ValueError(f"{field} must be a date in YYYY-MM-DD format")
+
 class RA(db.Model):
     __tablename__ = 'ras'
     
@@ -24,26 +36,30 @@ class RA(db.Model):
     
     @classmethod
     def find_by_name(cls, name):
-        """Find an RA by name (case-insensitive)"""
-        return cls.query.filter(cls.name.ilike(name.strip())).first()
+        """Find an RA by name (case-insensitive, uses the lower(name) index)"""
+        return cls.query.filter(db.func.lower(cls.name) == name.strip().lower()).first()
 
 class Duty(db.Model):
     __tablename__ = 'duties'
     
     id = db.Column(db.Integer, primary_key=True)
     ra_id = db.Column(db.Integer, db.ForeignKey('ras.id'), nullable=False)
-    ra_name = db.Column(db.String, nullable=False)
     date = db.Column(db.String, nullable=False)
     shift = db.Column(db.String, nullable=False)
     notes = db.Column(db.Text)
     created_at = db.Column(db.String, default=lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     
+    @validates('date')
+    def validate_date(self, key, value):
+        """The duties table only accepts YYYY-MM-DD dates (CHECK constraint)"""
+        return iso_date(value)
+    
     def to_dict(self):
         """Convert Duty object to dictionary for JSON serialization"""
         return {
             'id': self.id,
             'ra_id': self.ra_id,
-            'ra_name': self.ra_name,
+            'ra_name': self.ra_object.name if self.ra_object else None,
             'date': self.date,
             'shift': self.shift,
             'notes': self.notes,
@@ -62,6 +78,6 @@ class Duty(db.Model):
             query = query.filter(cls.date <= end_date)
             
         if ra_name:
-            query = query.filter(cls.ra_name.ilike(f"%{ra_name}%"))
+            query = query.join(RA).filter(RA.name.ilike(f"%{ra_name}%"))
             
         return query.order_by(cls.date).all()
\ No newline at end of file
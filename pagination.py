@@ -0,0 +1,76 @@
+import base64
+import json
+import sqlite3
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched from the cursor per step while streaming
+STREAM_BATCH_SIZE = 500
+
+
+def encode_cursor(date, duty_id):
+    """Encode the (date, id) keyset position of the last row on a page"""
+    raw = json.dumps([date, duty_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor(); raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, duty_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(date, str) or not isinstance(duty_id, int):
+        raise ValueError("Invalid pagination cursor")
+    return date, duty_id
+
+
+def parse_limit(value):
+    """Parse the limit query parameter, clamped to MAX_PAGE_SIZE"""
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def iter_batches(connect, query, params):
+    """Yield lists of row dicts from a server-side cursor
+
+    The connection is only checked out once iteration starts and is released
+    when the generator finishes or is closed.
+    """
+    conn = connect()
+    try:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def stream_ndjson(batches, dumps):
+    """One JSON document per line, one chunk per batch"""
+    for batch in batches:
+        yield ''.join(dumps(row) + '\n' for row in batch)
+
+
+def stream_json_array(batches, dumps):
+    """A single JSON array, one chunk per batch"""
+    yield '['
+    separator = ''
+    for batch in batches:
+        yield separator + ','.join(dumps(row) for row in batch)
+        separator = ','
+    yield ']'
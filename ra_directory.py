@@ -0,0 +1,89 @@
+import threading
+from collections import namedtuple
+
+RAEntry = namedtuple('RAEntry', ['id', 'name', 'email'])
+
+SELECT_ALL_RAS = "SELECT id, name, email FROM ras"
+
+
+def normalize_name(name):
+    """Key used to compare RA names: surrounding whitespace and case are ignored"""
+    return name.strip().casefold()
+
+
+class RADirectory:
+    """In-process cache of the ras table keyed by normalized name and by id
+
+    The cache is filled with one query on first use. Handlers that write RAs
+    update it after they commit (write-through), and anything that changes ras
+    in bulk calls invalidate() so the next lookup reloads it. The unique index
+    on lower(name) remains the authority on duplicates.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._by_id = None
+        self._by_name = None
+
+    def _load(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute(SELECT_ALL_RAS).fetchall()
+        finally:
+            conn.close()
+        by_id = {}
+        by_name = {}
+        for ra_id, name, email in rows:
+            entry = RAEntry(ra_id, name, email)
+            by_id[ra_id] = entry
+            by_name[normalize_name(name)] = entry
+        return by_id, by_name
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._by_id is None:
+                self._by_id, self._by_name = self._load()
+            return self._by_id, self._by_name
+
+    def get(self, ra_id):
+        """Return the RAEntry with this id, or None"""
+        by_id, _ = self._ensure_loaded()
+        return by_id.get(ra_id)
+
+    def find(self, name):
+        """Return the RAEntry whose name matches case-insensitively, or None"""
+        _, by_name = self._ensure_loaded()
+        return by_name.get(normalize_name(name))
+
+    def entries(self):
+        """All cached RAs"""
+        by_id, _ = self._ensure_loaded()
+        return list(by_id.values())
+
+    def put(self, ra_id, name, email=None):
+        """Record a created or updated RA"""
+        with self._lock:
+            if self._by_id is None:
+                return
+            old = self._by_id.get(ra_id)
+            if old is not None and self._by_name.get(normalize_name(old.name)) is old:
+                del self._by_name[normalize_name(old.name)]
+            entry = RAEntry(ra_id, name, email)
+            self._by_id[ra_id] = entry
+            self._by_name[normalize_name(name)] = entry
+
+    def remove(self, ra_id):
+        """Forget a deleted RA"""
+        with self._lock:
+            if self._by_id is None:
+                return
+            old = self._by_id.pop(ra_id, None)
+            if old is not None and self._by_name.get(normalize_name(old.name)) is old:
+                del self._by_name[normalize_name(old.name)]
+
+    def invalidate(self):
+        """Drop everything; the next lookup reloads from the database"""
+        with self._lock:
+            self._by_id = None
+            self._by_name = None
@@ -0,0 +1,204 @@
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+
+SHIFTS = ('Primary', 'Secondary', 'Tertiary')
+MAX_SCHEDULE_DAYS = 366
+
+Assignment = namedtuple('Assignment', ['date', 'shift', 'ra_id'])
+ScheduleResult = namedtuple('ScheduleResult', ['assignments', 'unfilled', 'counts'])
+
+GET_EXISTING_DUTIES = "SELECT date, shift, ra_id FROM duties WHERE date >= ? AND date <= ?"
+GET_PRIOR_COUNTS = "SELECT ra_id, primary_count, secondary_count, tertiary_count FROM ra_duty_summary"
+
+
+def parse_date(value, field):
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"{field} must be a date in YYYY-MM-DD format")
+
+
+def parse_schedule_request(data, directory):
+    """Validate a preview/commit request body into generate_schedule() arguments
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("A JSON object is required")
+
+    start = parse_date(data.get('start_date'), 'start_date')
+    end = parse_date(data.get('end_date'), 'end_date')
+    if end < start:
+        raise ValueError("end_date must not be before start_date")
+    if (end - start).days >= MAX_SCHEDULE_DAYS:
+        raise ValueError(f"A schedule can cover at most {MAX_SCHEDULE_DAYS} days")
+
+    max_per_week = data.get('max_shifts_per_week')
+    if max_per_week is not None and (not isinstance(max_per_week, int) or max_per_week < 1):
+        raise ValueError("max_shifts_per_week must be a positive integer")
+
+    shifts = data.get('shifts') or list(SHIFTS)
+    if not isinstance(shifts, list) or any(shift not in SHIFTS for shift in shifts):
+        raise ValueError(f"shifts must be a list drawn from {', '.join(SHIFTS)}")
+    # A repeated shift would be filled twice on the same day
+    if len(set(shifts)) != len(shifts):
+        raise ValueError("shifts must not repeat a shift")
+
+    ra_ids = data.get('ra_ids')
+    if ra_ids is not None and not isinstance(ra_ids, list):
+        raise ValueError("ra_ids must be a list of RA ids")
+    if ra_ids is None:
+        ras = directory.entries()
+    else:
+        ras = [directory.get(ra_id) for ra_id in ra_ids]
+        if None in ras:
+            raise ValueError("ra_ids contains an unknown RA")
+    if not ras:
+        raise ValueError("There are no RAs to schedule")
+
+    # Unavailability is keyed by RA id or by RA name
+    unavailability = data.get('unavailability') or {}
+    if not isinstance(unavailability, dict):
+        raise ValueError("unavailability must be an object mapping RA ids or names to lists of dates")
+    unavailable = defaultdict(set)
+    for key, dates in unavailability.items():
+        entry = directory.get(int(key)) if str(key).isdigit() else directory.find(key)
+        if entry is None:
+            raise ValueError(f"Unknown RA in unavailability: {key}")
+        if not isinstance(dates, list):
+            raise ValueError(f"unavailability of {key} must be a list of dates")
+        for value in dates:
+            unavailable[entry.id].add(parse_date(value, 'unavailability dates'))
+
+    return {
+        'ra_ids': sorted(entry.id for entry in ras),
+        'start': start,
+        'end': end,
+        'shifts': tuple(shifts),
+        'unavailable': unavailable,
+        'max_per_week': max_per_week,
+        'use_history': bool(data.get('use_history', True)),
+    }
+
+
+def load_schedule_inputs(cursor, start, end, use_history):
+    """Read the duties already in the window and, optionally, historic shift counts"""
+    cursor.execute(GET_EXISTING_DUTIES, (start.isoformat(), end.isoformat()))
+    existing = []
+    for day, shift, ra_id in cursor.fetchall():
+        try:
+            existing.append(Assignment(date.fromisoformat(day), shift, ra_id))
+        except ValueError:
+            continue
+
+    prior_counts = {}
+    if use_history:
+        cursor.execute(GET_PRIOR_COUNTS)
+        for ra_id, primary, secondary, tertiary in cursor.fetchall():
+            prior_counts[ra_id] = dict(zip(SHIFTS, (primary, secondary, tertiary)))
+    return existing, prior_counts
+
+
+def generate_schedule(ra_ids, start, end, shifts=SHIFTS, unavailable=None,
+                      max_per_week=None, existing=(), prior_counts=None):
+    """Fill every (day, shift) slot in [start, end] with an RA
+
+    Greedy with repair: slots are filled day by day, each going to the
+    eligible RA with the fewest shifts of that type so far, then the fewest
+    shifts overall, then the longest rest since their last duty. Eligible
+    means available that day, not already on duty that day and under
+    max_per_week for that ISO week. Slots that nothing fits are retried by
+    moving one of a capped RA's other shifts that week to someone else.
+    Slots already taken by existing duties are left alone but count towards
+    fairness and the weekly caps. Runs in O(days * shifts * RAs).
+    """
+    unavailable = unavailable or {}
+    prior_counts = prior_counts or {}
+
+    shift_counts = {ra_id: dict(prior_counts.get(ra_id, {})) for ra_id in ra_ids}
+    totals = {ra_id: sum(shift_counts[ra_id].values()) for ra_id in ra_ids}
+    last_day = {ra_id: None for ra_id in ra_ids}
+    week_counts = defaultdict(int)  # (ra_id, iso year, iso week) -> shifts
+    on_duty = defaultdict(set)      # day -> ra ids with a duty that day
+    taken = set()                   # (day, shift) slots already filled
+    assignments = {}                # (day, shift) -> ra_id, new assignments only
+
+    def week(day):
+        return day.isocalendar()[:2]
+
+    def record(ra_id, day, shift, delta=1):
+        if ra_id in shift_counts:
+            shift_counts[ra_id][shift] = shift_counts[ra_id].get(shift, 0) + delta
+            totals[ra_id] += delta
+        week_counts[(ra_id, *week(day))] += delta
+        if delta > 0:
+            on_duty[day].add(ra_id)
+        else:
+            on_duty[day].discard(ra_id)
+
+    for duty in existing:
+        taken.add((duty.date, duty.shift))
+        record(duty.ra_id, duty.date, duty.shift)
+
+    def eligible(ra_id, day, ignore_cap=False):
+        if day in unavailable.get(ra_id, ()) or ra_id in on_duty[day]:
+            return False
+        if max_per_week and not ignore_cap:
+            return week_counts[(ra_id, *week(day))] < max_per_week
+        return True
+
+    def rank(ra_id, day, shift):
+        rest = (day - last_day[ra_id]).days if last_day[ra_id] else 10 ** 6
+        return (shift_counts[ra_id].get(shift, 0), totals[ra_id], -rest, ra_id)
+
+    unfilled = []
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    for day in days:
+        for shift in shifts:
+            if (day, shift) in taken:
+                continue
+            candidates = [ra_id for ra_id in ra_ids if eligible(ra_id, day)]
+            if not candidates:
+                unfilled.append((day, shift))
+                continue
+            ra_id = min(candidates, key=lambda candidate: rank(candidate, day, shift))
+            assignments[(day, shift)] = ra_id
+            record(ra_id, day, shift)
+            last_day[ra_id] = day
+
+    # Repair: free a capped RA by handing one of their other shifts that week to someone else
+    still_unfilled = []
+    for day, shift in unfilled:
+        repaired = False
+        capped = [ra_id for ra_id in ra_ids if eligible(ra_id, day, ignore_cap=True)]
+        for ra_id in sorted(capped, key=lambda candidate: rank(candidate, day, shift)):
+            for (other_day, other_shift), holder in list(assignments.items()):
+                if holder != ra_id or other_day == day or week(other_day) != week(day):
+                    continue
+                replacements = [
+                    other for other in ra_ids
+                    if other != ra_id and eligible(other, other_day)
+                ]
+                if not replacements:
+                    continue
+                replacement = min(replacements, key=lambda candidate: rank(candidate, other_day, other_shift))
+                record(ra_id, other_day, other_shift, -1)
+                assignments[(other_day, other_shift)] = replacement
+                record(replacement, other_day, other_shift)
+                assignments[(day, shift)] = ra_id
+                record(ra_id, day, shift)
+                repaired = True
+                break
+            if repaired:
+                break
+        if not repaired:
+            still_unfilled.append((day, shift))
+
+    ordered = sorted(
+        (Assignment(day, shift, ra_id) for (day, shift), ra_id in assignments.items()),
+        key=lambda assignment: (assignment.date, shifts.index(assignment.shift))
+    )
+    counts = {ra_id: {shift: 0 for shift in shifts} for ra_id in ra_ids}
+    for assignment in ordered:
+        counts[assignment.ra_id][assignment.shift] += 1
+    return ScheduleResult(ordered, still_unfilled, counts)
@@ -0,0 +1,107 @@
+import re
+
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+RA_MATCH_LIMIT = 20
+
+# Words of a search box query; everything else (quotes, operators, column
+# filters) is dropped so user input can never be an FTS5 syntax error
+WORD = re.compile(r'\w+')
+
+# Queries matching more duty notes than this are not ranked by bm25, which
+# has to score every match; the most recently added matches are returned
+RANKED_MATCH_LIMIT = 2000
+
+COUNT_NOTE_MATCHES = "SELECT COUNT(*) FROM (SELECT rowid FROM duties_fts WHERE duties_fts MATCH ? LIMIT ?)"
+
+# Duties whose notes match; ordered by bm25 or, for broad queries, by rowid
+# (newest first), which lets the FTS5 scan stop after `limit` hits
+SEARCH_NOTES = """
+    SELECT d.id, d.ra_id, r.name AS ra_name, d.date, d.shift, d.notes, d.created_at,
+           bm25(duties_fts) AS rank
+    FROM duties_fts JOIN duties d ON d.id = duties_fts.rowid
+    LEFT JOIN ras r ON r.id = d.ra_id
+    WHERE duties_fts MATCH ? {date_filters}
+    ORDER BY {order}
+    LIMIT ?
+"""
+
+# Latest duties of the best matching RAs, at most `limit` per RA from idx_duties_ra_date
+SEARCH_RA_DUTIES = """
+    SELECT d.id, d.ra_id, m.name AS ra_name, d.date, d.shift, d.notes, d.created_at, m.rank
+    FROM (
+        SELECT rowid AS ra_id, name, bm25(ras_fts) AS rank
+        FROM ras_fts WHERE ras_fts MATCH ? ORDER BY rank LIMIT ?
+    ) m
+    JOIN duties d ON d.id IN (
+        SELECT id FROM duties WHERE ra_id = m.ra_id {date_filters}
+        ORDER BY date DESC, id DESC LIMIT ?
+    )
+"""
+SEARCH_RAS = """
+    SELECT r.id, r.name, r.email
+    FROM ras_fts JOIN ras r ON r.id = ras_fts.rowid
+    WHERE ras_fts MATCH ?
+    ORDER BY bm25(ras_fts)
+    LIMIT ?
+"""
+
+
+def match_query(text):
+    """FTS5 query where every word must match, each as a prefix; raises ValueError without words"""
+    words = WORD.findall(text or '')
+    if not words:
+        raise ValueError("q must contain at least one word")
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _date_filters(column, start_date, end_date):
+    clauses = ""
+    params = []
+    if start_date:
+        clauses += f" AND {column} >= ?"
+        params.append(start_date)
+    if end_date:
+        clauses += f" AND {column} <= ?"
+        params.append(end_date)
+    return clauses, params
+
+
+def search(cursor, text, start_date='', end_date='', limit=DEFAULT_SEARCH_LIMIT):
+    """Ranked duties and RAs matching a search box query, duties limited to a date range
+
+    A duty matches through its notes or through its RA's name and keeps the
+    better of the two bm25 scores; ties go to the latest date. Returns
+    {"duties", "ras", "ranked"}, where ranked is False when the notes
+    matched too many duties to score and the newest matches were used.
+    """
+    query = match_query(text)
+
+    cursor.execute(COUNT_NOTE_MATCHES, (query, RANKED_MATCH_LIMIT + 1))
+    ranked = cursor.fetchone()[0] <= RANKED_MATCH_LIMIT
+    date_filters, date_params = _date_filters('d.date', start_date, end_date)
+    cursor.execute(
+        SEARCH_NOTES.format(date_filters=date_filters, order='rank' if ranked else 'duties_fts.rowid DESC'),
+        [query, *date_params, limit]
+    )
+    columns = [column[0] for column in cursor.description]
+    rows = cursor.fetchall()
+
+    date_filters, date_params = _date_filters('date', start_date, end_date)
+    cursor.execute(
+        SEARCH_RA_DUTIES.format(date_filters=date_filters),
+        [query, RA_MATCH_LIMIT, *date_params, limit]
+    )
+    rows.extend(cursor.fetchall())
+
+    best = {}
+    for row in rows:
+        duty = dict(zip(columns, row))
+        if duty['id'] not in best or duty['rank'] < best[duty['id']]['rank']:
+            best[duty['id']] = duty
+    duties = sorted(best.values(), key=lambda duty: (duty['date'], duty['id']), reverse=True)
+    duties.sort(key=lambda duty: duty['rank'])
+
+    cursor.execute(SEARCH_RAS, (query, RA_MATCH_LIMIT))
+    ras = [{"id": ra_id, "name": name, "email": email} for ra_id, name, email in cursor.fetchall()]
+    return {"duties": duties[:limit], "ras": ras, "ranked": ranked}
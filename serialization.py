@@ -0,0 +1,46 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; the standard library encoder is used without it
+    orjson = None
+
+# Values of the ?format= parameter on list endpoints
+OBJECT_FORMAT = 'objects'
+COLUMN_FORMAT = 'columns'
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+
+def parse_format(value):
+    """Validate the ?format= parameter; raises ValueError for unknown formats"""
+    value = value or OBJECT_FORMAT
+    if value not in (OBJECT_FORMAT, COLUMN_FORMAT):
+        raise ValueError(f"format must be '{OBJECT_FORMAT}' or '{COLUMN_FORMAT}'")
+    return value
+
+
+def fetch_columns(cursor, query, params=()):
+    """Run a query and return (column names, rows as plain tuples)"""
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    return [column[0] for column in cursor.description], rows
+
+
+def shape_rows(columns, rows, fmt):
+    """Rows as a list of objects, or column-oriented {"columns": [...], "rows": [[...]]}"""
+    if fmt == COLUMN_FORMAT:
+        return {"columns": columns, "rows": rows}
+    return [dict(zip(columns, row)) for row in rows]
@@ -0,0 +1,138 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from calendar_view import CalendarCache
+from conflicts import OccupancyIndex
+from database import ConnectionPool
+from events import EventHub
+from exports import FeedCache
+from ra_directory import RADirectory
+
+# Requests pick their building with this header or the ?building= parameter;
+# without either they use the default database
+BUILDING_HEADER = 'X-Building'
+BUILDING_PARAM = 'building'
+DEFAULT_BUILDING = 'default'
+
+# Building names double as file names, so keep them to a safe alphabet
+BUILDING_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+# Upper bound on threads used to query shards in parallel
+MAX_PARALLEL_SHARDS = 16
+
+
+class UnknownBuilding(LookupError):
+    """No database exists for the requested building"""
+
+
+class Shard:
+    """One building's database file with its own connection pool, caches and event hub
+
+    Every building has its own SQLite writer lock, so writes to different
+    halls never wait on each other.
+    """
+
+    def __init__(self, building, path):
+        self.building = building
+        self.path = path
+        self.pool = ConnectionPool(path)
+        self.ra_directory = RADirectory(self.pool.connect)
+        self.occupancy = OccupancyIndex(self.pool.connect)
+        self.event_hub = EventHub()
+        self.calendar_cache = CalendarCache()
+        self.feed_cache = FeedCache()
+        self.event_hub.add_listener(self.calendar_cache.handle_event)
+        self.event_hub.add_listener(self.feed_cache.handle_event)
+
+    def connect(self):
+        return self.pool.connect()
+
+
+class ShardRouter:
+    """Maps building names to shards, opening each shard on first use
+
+    The default building is the single database the app always had; every
+    other building lives in <shards_dir>/<building>.db, and a building exists
+    once `flask --app app init-db --building <name>` has created its file.
+    """
+
+    def __init__(self, default_path, shards_dir):
+        self.default_path = default_path
+        self.shards_dir = shards_dir
+        self._lock = threading.Lock()
+        self._shards = {}
+        # Optional callable(sql, seconds) installed on every shard's pool
+        self.query_hook = None
+        # Optional callable(shard) run once for every shard when it is opened
+        self.on_open = None
+
+    def path_for(self, building):
+        if building == DEFAULT_BUILDING:
+            return self.default_path
+        if not BUILDING_NAME.match(building or ''):
+            raise UnknownBuilding(
+                "Building names are 1-64 lowercase letters, digits, '-' or '_'"
+            )
+        return os.path.join(self.shards_dir, f"{building}.db")
+
+    def get(self, building=None, create=False):
+        """The shard for a building (default when None); raises UnknownBuilding
+
+        With create=True a missing database file is allowed, so init-db can
+        create it.
+        """
+        building = building or DEFAULT_BUILDING
+        shard = self._shards.get(building)
+        if shard is not None:
+            return shard
+
+        path = self.path_for(building)
+        if not create and building != DEFAULT_BUILDING and not os.path.exists(path):
+            raise UnknownBuilding(f"Unknown building '{building}'")
+        if create:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._lock:
+            shard = self._shards.get(building)
+            if shard is not None:
+                return shard
+            shard = self._shards[building] = Shard(building, path)
+            shard.pool.query_hook = self.query_hook
+        if self.on_open is not None:
+            self.on_open(shard)
+        return shard
+
+    def buildings(self):
+        """The default building followed by every building with a database file"""
+        names = []
+        if os.path.isdir(self.shards_dir):
+            names = sorted(
+                name[:-3] for name in os.listdir(self.shards_dir)
+                if name.endswith('.db') and BUILDING_NAME.match(name[:-3])
+            )
+        return [DEFAULT_BUILDING] + [name for name in names if name != DEFAULT_BUILDING]
+
+    def shards(self):
+        return [self.get(building) for building in self.buildings()]
+
+    def open_shards(self):
+        """Shards opened so far (the ones with pools and caches to manage)"""
+        with self._lock:
+            return list(self._shards.values())
+
+    def map(self, function):
+        """Run function(shard) on every shard in parallel; returns [(building, result)]
+
+        Each call runs on its own thread and so gets its own pooled
+        connection, and the slowest building bounds the total time.
+        """
+        shards = self.shards()
+        with ThreadPoolExecutor(max_workers=min(len(shards), MAX_PARALLEL_SHARDS),
+                                thread_name_prefix='shard') as executor:
+            results = list(executor.map(function, shards))
+        return [(shard.building, result) for shard, result in zip(shards, results)]
+
+    def dispose(self):
+        for shard in self.open_shards():
+            shard.pool.dispose()
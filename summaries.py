@@ -0,0 +1,56 @@
+SHIFT_COLUMNS = (
+    ('Primary', 'primary_count'),
+    ('Secondary', 'secondary_count'),
+    ('Tertiary', 'tertiary_count'),
+)
+
+COUNT_COLUMNS = ('total_duties',) + tuple(column for _, column in SHIFT_COLUMNS)
+
+# Counter tables keyed by RA and by month; (table, key column, key expression over a duties row)
+SUMMARY_TABLES = (
+    ('ra_duty_counts', 'ra_id', '{row}.ra_id'),
+    ('monthly_duty_counts', 'year_month', "strftime('%Y-%m', {row}.date)"),
+)
+
+
+def _aggregate_query(key, key_expr):
+    """GROUP BY over duties that produces what a counter table should contain"""
+    key_value = key_expr.format(row='duties')
+    shift_sums = ', '.join(
+        f"SUM(CASE WHEN shift = '{shift}' THEN 1 ELSE 0 END)" for shift, _ in SHIFT_COLUMNS
+    )
+    return f'''
+        SELECT {key_value} AS {key}, COUNT(*), {shift_sums}
+        FROM duties
+        WHERE {key_value} IS NOT NULL
+        GROUP BY 1
+    '''
+
+
+def rebuild_summaries(cursor):
+    """Recompute every counter table from the duties table"""
+    for table, key, key_expr in SUMMARY_TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(
+            f"INSERT INTO {table} ({key}, {', '.join(COUNT_COLUMNS)}) {_aggregate_query(key, key_expr)}"
+        )
+
+
+def check_summaries(cursor):
+    """Compare the counter tables with a fresh aggregation of duties
+
+    Returns a list of (table, key, expected counts, stored counts) for every
+    key that differs; an empty list means the counters are consistent.
+    """
+    mismatches = []
+    for table, key, key_expr in SUMMARY_TABLES:
+        cursor.execute(_aggregate_query(key, key_expr))
+        expected = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+        cursor.execute(f"SELECT {key}, {', '.join(COUNT_COLUMNS)} FROM {table}")
+        stored = {row[0]: tuple(row[1:]) for row in cursor.fetchall() if row[1] != 0}
+
+        for value in sorted(set(expected) | set(stored), key=str):
+            if expected.get(value) != stored.get(value):
+                mismatches.append((table, value, expected.get(value), stored.get(value)))
+    return mismatches
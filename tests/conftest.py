@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Importing app must never touch the real database files
+_scratch = tempfile.mkdtemp(prefix='ra-duty-tracker-tests-')
+os.environ.setdefault('RA_DUTY_TRACKER_DB', os.path.join(_scratch, 'default.db'))
+os.environ.setdefault('RA_DUTY_TRACKER_SHARDS_DIR', os.path.join(_scratch, 'buildings'))
@@ -0,0 +1,39 @@
+"""Smoke check for the benchmark's synthetic data seeding"""
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import api_benchmark
+import app as app_module
+
+
+@pytest.fixture
+def shard(tmp_path, monkeypatch):
+    shard = app_module.router.get('bench-seed', create=True)
+    monkeypatch.setattr(app_module, 'current_shard', lambda: shard)
+    app_module.init_database(sample_data=True)
+    yield shard
+    shard.pool.dispose()
+
+
+def count_duties(shard):
+    conn = shard.connect()
+    try:
+        return conn.execute("SELECT COUNT(*), COUNT(DISTINCT date || shift) FROM duties").fetchone()
+    finally:
+        conn.close()
+
+
+def test_seed_runs_past_existing_duties(shard, monkeypatch):
+    # Start just before the demo duties (2025-03-28 to 2025-04-01) so the seed has to pass them
+    monkeypatch.setattr(api_benchmark, 'FIRST_DAY', date(2025, 3, 20))
+    api_benchmark.seed(app_module, 40)
+    assert count_duties(shard) == (40, 40)
+
+    # A second scale continues where the first one stopped
+    api_benchmark.seed(app_module, 100)
+    assert count_duties(shard) == (100, 100)
@@ -0,0 +1,56 @@
+"""Conditional GET handling around writes that share a second"""
+import sqlite3
+
+import pytest
+from flask import Flask
+from werkzeug.http import http_date
+
+import http_cache
+from migrations import create_data_version
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / 'version.db'
+    conn = sqlite3.connect(path)
+    # The version triggers need the tables they watch
+    conn.execute("CREATE TABLE ras (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE duties (id INTEGER PRIMARY KEY, ra_id INTEGER, date TEXT)")
+    create_data_version(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    test_app = Flask(__name__)
+
+    @test_app.route('/duties')
+    @http_cache.conditional(lambda: sqlite3.connect(path))
+    def duties():
+        return {'duties': []}
+
+    def write(updated_at):
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE data_version SET version = version + 1, updated_at = ?", (updated_at,))
+        conn.commit()
+        conn.close()
+
+    test_client = test_app.test_client()
+    test_client.write = write
+    return test_client
+
+
+def test_write_in_the_same_second_is_not_hidden_by_a_304(client, monkeypatch):
+    client.write(1000.2)
+    monkeypatch.setattr(http_cache.time, 'time', lambda: 1000.5)
+    response = client.get('/duties')
+    assert response.status_code == 200
+    # The second isn't over yet, so there is no date a client could send back
+    assert 'Last-Modified' not in response.headers
+
+    client.write(1000.8)
+    monkeypatch.setattr(http_cache.time, 'time', lambda: 1002.0)
+    response = client.get('/duties', headers={'If-Modified-Since': http_date(1000)})
+    assert response.status_code == 200
+    assert response.headers['Last-Modified'] == http_date(1001)
+
+    response = client.get('/duties', headers={'If-Modified-Since': http_date(1001)})
+    assert response.status_code == 304
@@ -0,0 +1,120 @@
+"""Every managed duties query must be answered from an index
+
+The database is built by the real migrations and seeded with enough duties
+for the planner's statistics to matter, so dropping or renaming one of the
+managed indexes fails here.
+"""
+import re
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import analytics
+import archive
+import calendar_view
+import conflicts
+import exports
+import scheduler
+import search
+from app import PreparedStatements
+from indexes import MANAGED_INDEXES, explain_query_plan, find_full_scans
+from migrations import EMPTY_MIGRATIONS, migrate
+
+SHIFTS = ('Primary', 'Secondary', 'Tertiary')
+RA_COUNT = 40
+DAYS = 1000
+
+# A full table scan of duties, by name or by the d alias the queries use
+DUTY_SCAN = re.compile(r'^SCAN (duties|d)$')
+
+# Every statement that reads duties, with its templates filled in (optional
+# filters left out), and the index its plan has to use. Planning against the
+# wrong index is as slow as a table scan on a big table, so a missing index
+# fails here even when SQLite falls back to scanning another one.
+DUTY_QUERIES = {
+    'PreparedStatements.COUNT_DUTIES_BY_RA': (PreparedStatements.COUNT_DUTIES_BY_RA, 'idx_duties_ra_date'),
+    'PreparedStatements.GET_FILTERED_DUTIES': (PreparedStatements.GET_FILTERED_DUTIES, 'idx_duties_date'),
+    'PreparedStatements.GET_DUTIES_PAGE': (PreparedStatements.GET_DUTIES_PAGE, 'idx_duties_date'),
+    'PreparedStatements.GET_FILTERED_HISTORY': (PreparedStatements.GET_FILTERED_HISTORY, 'idx_duties_date'),
+    'PreparedStatements.GET_HISTORY_PAGE': (PreparedStatements.GET_HISTORY_PAGE, 'idx_duties_date'),
+    'PreparedStatements.RA_DUTIES_REPORT': (PreparedStatements.RA_DUTIES_REPORT, 'idx_duties_ra_date'),
+    'PreparedStatements.MONTHLY_SUMMARY': (PreparedStatements.MONTHLY_SUMMARY, 'idx_duties_date_shift_unique'),
+    'conflicts.GET_DUTIES_ON_DATE': (conflicts.GET_DUTIES_ON_DATE, 'idx_duties_date_shift_unique'),
+    'conflicts.GET_DUTIES_IN_RANGE': (conflicts.GET_DUTIES_IN_RANGE, 'idx_duties_date_shift_unique'),
+    'conflicts.SCAN_DUTIES_BY_DATE': (conflicts.SCAN_DUTIES_BY_DATE, 'idx_duties_date'),
+    'calendar_view.GET_DUTIES_IN_WINDOW': (calendar_view.GET_DUTIES_IN_WINDOW, 'idx_duties_date'),
+    'scheduler.GET_EXISTING_DUTIES': (scheduler.GET_EXISTING_DUTIES, 'idx_duties_date_shift_unique'),
+    'exports.GET_RA_FEED': (exports.GET_RA_FEED.format(source='duties', date_filters=''), 'idx_duties_ra_date'),
+    'archive.COPY_TO_ARCHIVE': (archive.COPY_TO_ARCHIVE, 'idx_duties_date'),
+    'archive.DELETE_ARCHIVED': (archive.DELETE_ARCHIVED, 'idx_duties_date'),
+    'analytics.GET_DUTY_ARRAYS': (analytics.GET_DUTY_ARRAYS.format(source='duties'), 'idx_duties_date_shift_unique'),
+    'analytics.GET_DATE_RANGE': (analytics.GET_DATE_RANGE.format(table='duties'), 'idx_duties_date'),
+    'search.SEARCH_RA_DUTIES': (search.SEARCH_RA_DUTIES.format(date_filters=''), 'idx_duties_ra_date'),
+}
+
+
+def plan_problems(cursor, query, index):
+    """Full scans of duties in a query's plan, and a note if it does not use `index`"""
+    plan = explain_query_plan(cursor, re.sub(r'\{\w+\}', '', query))
+    problems = [line for line in plan if DUTY_SCAN.match(line)]
+    if not any(re.search(rf'\bINDEX {index}\b', line) for line in plan):
+        problems.append(f"does not use {index}: {plan}")
+    return problems
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    # No statement cache: a cached EXPLAIN is not re-planned after DROP INDEX
+    conn = sqlite3.connect(tmp_path_factory.mktemp('plans') / 'duties.db', cached_statements=0)
+    migrate(conn, EMPTY_MIGRATIONS)
+    conn.executemany(
+        "INSERT INTO ras (id, name, email) VALUES (?, ?, ?)",
+        [(ra_id, f"RA {ra_id}", f"ra{ra_id}@example.edu") for ra_id in range(1, RA_COUNT + 1)]
+    )
+    first_day = date(2024, 1, 1)
+    conn.executemany(
+        "INSERT INTO duties (ra_id, date, shift, notes) VALUES (?, ?, ?, ?)",
+        [
+            ((day * len(SHIFTS) + position) % RA_COUNT + 1,
+             (first_day + timedelta(days=day)).isoformat(), shift, f"Duty note {day}")
+            for day in range(DAYS)
+            for position, shift in enumerate(SHIFTS)
+        ]
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    yield conn
+    conn.close()
+
+
+def test_prepared_statements_use_indexes(conn):
+    # The RA list returns every RA, so scanning ras is expected
+    assert find_full_scans(conn.cursor(), PreparedStatements, allowed=('GET_ALL_RAS',)) == []
+
+
+@pytest.mark.parametrize('name', sorted(DUTY_QUERIES))
+def test_duty_queries_use_their_index(conn, name):
+    query, index = DUTY_QUERIES[name]
+    assert plan_problems(conn.cursor(), query, index) == []
+
+
+def test_managed_indexes_exist(conn):
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {name for name, _, _ in MANAGED_INDEXES} <= names
+
+
+@pytest.mark.parametrize('index', sorted({index for _, index in DUTY_QUERIES.values()}))
+def test_dropped_index_is_detected(conn, index):
+    # DDL is transactional in SQLite, so the index comes back on rollback
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP INDEX {index}")
+        cursor = conn.cursor()
+        problems = [
+            name for name, (query, expected) in DUTY_QUERIES.items()
+            if plan_problems(cursor, query, expected)
+        ]
+    finally:
+        conn.rollback()
+    assert problems